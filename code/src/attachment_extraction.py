@@ -0,0 +1,293 @@
+import os
+import io
+import time
+import atexit
+import signal
+import logging
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures.process import BrokenProcessPool
+
+from worker_pools import create_process_pool
+
+logger = logging.getLogger(__name__)
+
+# Caps for the pipeline's attachment stage: attachments whose encoded size is above
+# ATTACHMENT_MAX_BYTES are skipped, and at most ATTACHMENT_TEXT_MAX_CHARS characters of
+# text per email are added to the classification input
+ATTACHMENT_MAX_BYTES = 5 * 1024 * 1024
+ATTACHMENT_TEXT_MAX_CHARS = 2000
+
+
+def join_within_budget(texts, max_chars=None):
+    """Joins texts with newlines, consuming the iterable only until max_chars characters are collected."""
+    collected = []
+    total = 0
+    for text in texts:
+        collected.append(text)
+        total += len(text) + 1
+        if max_chars and total >= max_chars:
+            break
+    return "\n".join(collected)
+
+
+# Extractors read a binary file object (usually a BytesIO over the decoded payload),
+# so attachments never have to be written to disk to be read
+
+def iter_pdf_pages(stream):
+    """Yields the text of each page that has any, running extract_text() once per page."""
+    import pdfplumber
+    with pdfplumber.open(stream) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text()
+            if text:
+                yield text
+
+
+def extract_text_from_pdf(stream, max_chars=None):
+    """Extracts text from a PDF file; pages after the first max_chars characters are not read."""
+    return join_within_budget(iter_pdf_pages(stream), max_chars)
+
+
+def extract_text_from_docx(stream, max_chars=None):
+    """Extracts text from a DOCX file."""
+    from docx import Document
+    doc = Document(stream)
+    return join_within_budget((para.text for para in doc.paragraphs), max_chars)
+
+
+def extract_text_from_doc(stream, max_chars=None):
+    """Extracts text from a DOC file using pypandoc."""
+    # pandoc only reads files, so the payload goes to a temporary directory removed after conversion
+    import pypandoc
+    with tempfile.TemporaryDirectory(prefix="attachment-") as tmp_dir:
+        doc_path = os.path.join(tmp_dir, "attachment.doc")
+        with open(doc_path, "wb") as f:
+            f.write(stream.read())
+        return pypandoc.convert_file(doc_path, "plain")
+
+
+def extract_text_from_txt(stream, max_chars=None):
+    """Extracts text from a TXT file."""
+    with io.TextIOWrapper(stream, encoding="utf-8") as f:
+        return f.read(max_chars or -1).strip()
+
+
+EXTRACTORS = {
+    ".pdf": extract_text_from_pdf,
+    ".docx": extract_text_from_docx,
+    ".doc": extract_text_from_doc,
+    ".txt": extract_text_from_txt
+}
+
+
+def get_extractor(filename):
+    return EXTRACTORS.get(os.path.splitext(filename)[1].lower())
+
+
+def process_attachment(filename, payload):
+    """Extracts text from a PDF, DOCX, DOC or TXT payload, with placeholder text on failure."""
+    extractor = get_extractor(filename)
+    file_type = os.path.splitext(filename)[1][1:].upper()
+    if extractor is None:
+        logger.warning(f"Unsupported file type: {filename}")
+        return "(Unsupported file type)"
+    try:
+        text = extractor(io.BytesIO(payload))
+    except Exception as e:
+        logger.error(f"Error reading {file_type} {filename}: {e}")
+        return f"(Error reading {file_type})"
+    return text if text else f"(No readable text in {file_type})"
+
+
+def is_extractable(attachment):
+    """True if the pipeline should extract this attachment: a supported type within the size cap."""
+    if get_extractor(attachment.name) is None:
+        return False
+    return attachment.size is None or attachment.size <= ATTACHMENT_MAX_BYTES
+
+
+@contextmanager
+def time_limit(seconds):
+    """Raises TimeoutError inside the block once seconds have passed."""
+    # SIGALRM only reaches the main thread (as in the pool workers); elsewhere the block runs unbounded
+    if not seconds or not hasattr(signal, "SIGALRM") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise TimeoutError(f"Attachment extraction took longer than {seconds}s")
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def extract_attachment_text(attachment, timeout=None):
+    """Decodes a LazyAttachment and returns its text, truncated to ATTACHMENT_TEXT_MAX_CHARS."""
+    # The timeout counts from the start of this call, in the worker; errors propagate to the caller
+    with time_limit(timeout):
+        payload = attachment.read()
+        if len(payload) > ATTACHMENT_MAX_BYTES:
+            logger.warning(f"Skipping attachment {attachment.name}: {len(payload)} bytes")
+            return ""
+        text = get_extractor(attachment.name)(io.BytesIO(payload), ATTACHMENT_TEXT_MAX_CHARS) or ""
+    return text[:ATTACHMENT_TEXT_MAX_CHARS]
+
+
+# Attachment workers: each extraction is stopped in its worker after ATTACHMENT_TIMEOUT seconds;
+# the pool is only torn down if one still has not returned after ATTACHMENT_HARD_TIMEOUT (stuck in C code)
+ATTACHMENT_WORKERS = min(4, os.cpu_count() or 1)
+ATTACHMENT_TIMEOUT = 30.0
+ATTACHMENT_HARD_TIMEOUT = 60.0
+ATTACHMENT_EXECUTOR = None
+ATTACHMENT_SLOTS = None
+# Submission time of each running extraction, by future
+ATTACHMENT_RUNNING = {}
+ATTACHMENT_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_attachment_executor():
+    """Returns the pool and a semaphore with one slot per worker."""
+    global ATTACHMENT_EXECUTOR, ATTACHMENT_SLOTS
+    with ATTACHMENT_EXECUTOR_LOCK:
+        if ATTACHMENT_EXECUTOR is None:
+            logger.info(f"Starting {ATTACHMENT_WORKERS} attachment workers")
+            ATTACHMENT_EXECUTOR = create_process_pool(ATTACHMENT_WORKERS)
+            ATTACHMENT_SLOTS = threading.Semaphore(ATTACHMENT_WORKERS)
+        return ATTACHMENT_EXECUTOR, ATTACHMENT_SLOTS
+
+
+def discard_attachment_executor(executor):
+    """Drops a broken pool or one with a hung extraction; its other in-flight attachments are skipped."""
+    global ATTACHMENT_EXECUTOR
+    with ATTACHMENT_EXECUTOR_LOCK:
+        if ATTACHMENT_EXECUTOR is executor:
+            ATTACHMENT_EXECUTOR = None
+        for future in [future for future, (owner, _) in ATTACHMENT_RUNNING.items() if owner is executor]:
+            del ATTACHMENT_RUNNING[future]
+    # ProcessPoolExecutor cannot cancel a running task, so stop its workers directly
+    # (before shutdown(), which drops the executor's reference to them)
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def shutdown_attachment_executor():
+    with ATTACHMENT_EXECUTOR_LOCK:
+        if ATTACHMENT_EXECUTOR is not None:
+            ATTACHMENT_EXECUTOR.shutdown(wait=True)
+
+
+atexit.register(shutdown_attachment_executor)
+
+
+def oldest_attachment_start(executor):
+    with ATTACHMENT_EXECUTOR_LOCK:
+        return min((started for owner, started in ATTACHMENT_RUNNING.values() if owner is executor), default=None)
+
+
+def acquire_attachment_worker():
+    """Waits for a free worker and returns (executor, slots) with its slot taken."""
+    while True:
+        executor, slots = get_attachment_executor()
+        oldest = oldest_attachment_start(executor)
+        wait = ATTACHMENT_HARD_TIMEOUT if oldest is None else oldest + ATTACHMENT_HARD_TIMEOUT - time.monotonic()
+        if slots.acquire(timeout=max(0.0, wait)):
+            return executor, slots
+        # Every worker is busy; the caller only collects (and checks) its extractions later,
+        # so a pool whose workers are all stuck is replaced here
+        oldest = oldest_attachment_start(executor)
+        if oldest is not None and time.monotonic() - oldest >= ATTACHMENT_HARD_TIMEOUT:
+            logger.error(f"Attachment extraction hung for {ATTACHMENT_HARD_TIMEOUT}s with every worker busy, restarting workers")
+            discard_attachment_executor(executor)
+
+
+def submit_attachment(attachment):
+    """Submits once a worker is free, so the extraction starts running when it is submitted."""
+    for attempt in range(2):
+        executor, slots = acquire_attachment_worker()
+        started = time.monotonic()
+        try:
+            future = executor.submit(extract_attachment_text, attachment, ATTACHMENT_TIMEOUT)
+        except BrokenProcessPool:
+            slots.release()
+            discard_attachment_executor(executor)
+            if attempt:
+                raise
+            continue
+        with ATTACHMENT_EXECUTOR_LOCK:
+            ATTACHMENT_RUNNING[future] = (executor, started)
+
+        def on_done(future, slots=slots):
+            with ATTACHMENT_EXECUTOR_LOCK:
+                ATTACHMENT_RUNNING.pop(future, None)
+            slots.release()
+
+        future.add_done_callback(on_done)
+        return attachment, executor, future, started
+
+
+def set_attachment_text(email_data, texts):
+    texts = [text for text in texts if text]
+    if texts:
+        email_data['attachment_text'] = "\n\n".join(texts)[:ATTACHMENT_TEXT_MAX_CHARS]
+
+
+def extract_attachments_inline(source, attachments):
+    texts = []
+    for attachment in attachments:
+        try:
+            texts.append(extract_attachment_text(attachment, ATTACHMENT_TIMEOUT))
+        except Exception as e:
+            logger.error(f"Error extracting attachment {attachment.name} in {source}: {str(e)}")
+    return texts
+
+
+def collect_attachment_text(source, email_data, submitted):
+    texts = []
+    for attachment, executor, future, started in submitted:
+        try:
+            text = future.result(timeout=max(0.0, started + ATTACHMENT_HARD_TIMEOUT - time.monotonic()))
+        except Exception as e:
+            if future.done():
+                # Includes the worker's own TimeoutError after ATTACHMENT_TIMEOUT
+                logger.error(f"Error extracting attachment {attachment.name} in {source}: {str(e)}")
+            else:
+                logger.error(f"Attachment extraction hung for {ATTACHMENT_HARD_TIMEOUT}s, restarting workers: {attachment.name} in {source}")
+                discard_attachment_executor(executor)
+            continue
+        texts.append(text)
+    set_attachment_text(email_data, texts)
+    return source, email_data
+
+
+def iter_with_attachment_text(parsed_emails):
+    """Sets email_data['attachment_text'] for each parsed (source, email_data) pair, in order."""
+    # Attachments of a bounded window of emails are extracted concurrently on the attachment workers
+    window = deque()
+    for source, email_data in parsed_emails:
+        attachments = [a for a in email_data['attachments'] if is_extractable(a)] if email_data else []
+        if not ATTACHMENT_WORKERS:
+            if attachments:
+                set_attachment_text(email_data, extract_attachments_inline(source, attachments))
+            yield source, email_data
+            continue
+        submitted = []
+        for attachment in attachments:
+            try:
+                submitted.append(submit_attachment(attachment))
+            except Exception as e:
+                logger.error(f"Error submitting attachment {attachment.name} in {source}: {str(e)}")
+        window.append((source, email_data, submitted))
+        if len(window) >= ATTACHMENT_WORKERS * 4:
+            yield collect_attachment_text(*window.popleft())
+    while window:
+        yield collect_attachment_text(*window.popleft())
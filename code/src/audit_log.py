@@ -0,0 +1,78 @@
+import json
+import queue
+import logging
+import threading
+
+from results_sink import rotate_file
+
+logger = logging.getLogger(__name__)
+
+AUDIT_LOG_FILE = "classification_log.jsonl"
+AUDIT_LOG_MAX_BYTES = 20 * 1024 * 1024
+AUDIT_LOG_BACKUP_COUNT = 5
+AUDIT_LOG_BUFFER_SIZE = 64 * 1024
+AUDIT_LOG_FLUSH_INTERVAL = 1.0
+
+_CLOSE = object()
+
+
+class AuditLogWriter:
+    """Classification audit log with a single owner thread.
+
+    Callers enqueue structured records; the writer thread appends them as JSON lines through a
+    buffered file, flushes when idle for flush_interval seconds and rotates past max_bytes.
+    """
+
+    def __init__(self, path=AUDIT_LOG_FILE, max_bytes=AUDIT_LOG_MAX_BYTES, backup_count=AUDIT_LOG_BACKUP_COUNT,
+                 buffer_size=AUDIT_LOG_BUFFER_SIZE, flush_interval=AUDIT_LOG_FLUSH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self._thread.start()
+
+    def log(self, record):
+        self._queue.put(record)
+
+    def flush(self):
+        """Blocks until every record logged so far is written to the OS."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def _run(self):
+        f = open(self.path, "a", encoding="utf-8", buffering=self.buffer_size)
+        size = f.tell()
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    f.flush()
+                    continue
+                if item is _CLOSE:
+                    break
+                if isinstance(item, threading.Event):
+                    f.flush()
+                    item.set()
+                    continue
+                try:
+                    line = json.dumps(item, default=str) + "\n"
+                    if self.max_bytes and size + len(line) > self.max_bytes and size > 0:
+                        f.close()
+                        rotate_file(self.path, self.backup_count)
+                        f = open(self.path, "a", encoding="utf-8", buffering=self.buffer_size)
+                        size = 0
+                    f.write(line)
+                    size += len(line)
+                except Exception as e:
+                    logger.error(f"Error writing audit record: {str(e)}")
+        finally:
+            f.close()
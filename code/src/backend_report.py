@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import email_processing as ep
+
+EMAIL_DIR = "emails/"
+REPORT_FILE = "backend_report.json"
+
+
+def run_backend(backend, emails):
+    """Runs intent and context inference for every email with the given backend."""
+    ep.set_inference_backend(backend)
+    ep.warm_up_models()
+
+    outputs = {}
+    started = time.perf_counter()
+    for filepath, email_data in emails:
+        processed = ep.infer_single_email(filepath, email_data)
+        if not processed:
+            continue
+        _, _, intent, context, primary_intent, _ = processed
+        scored_intent = ep.assign_priority_and_confidence(intent, email_data)
+        outputs[email_data['filename']] = {
+            'request_type': intent['request_type'],
+            'sub_request_type': intent['sub_request_type'],
+            'request_confidence': intent['request_confidence'],
+            'priority': scored_intent['priority'] if scored_intent else None,
+            'team': ep.ROUTING_RULES.get(intent['request_type'], "Default Team"),
+            'primary_segment_type': primary_intent['request_type'] if primary_intent else None,
+            'entities': sorted({(e['text'], e['label']) for e in context['entities']})
+        }
+    elapsed = time.perf_counter() - started
+    return outputs, elapsed
+
+
+def compare_backends(baseline, candidate):
+    """Lists every email whose routing-relevant output differs between the two backends."""
+    diffs = []
+    max_confidence_delta = 0.0
+    for filename, base in baseline.items():
+        other = candidate.get(filename)
+        if other is None:
+            diffs.append({'filename': filename, 'field': 'missing', 'baseline': True, 'candidate': None})
+            continue
+        for field in ('request_type', 'sub_request_type', 'priority', 'team', 'primary_segment_type', 'entities'):
+            if base[field] != other[field]:
+                diffs.append({'filename': filename, 'field': field, 'baseline': base[field], 'candidate': other[field]})
+        max_confidence_delta = max(max_confidence_delta, abs(base['request_confidence'] - other['request_confidence']))
+    return diffs, max_confidence_delta
+
+
+def build_report(directory, baseline_backend, candidate_backends):
+    filepaths = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".eml"))
+    emails = [(fp, data) for fp in filepaths for data in [ep.extract_email_components(fp)] if data]
+
+    baseline, baseline_time = run_backend(baseline_backend, emails)
+    report = {
+        'corpus': directory,
+        'emails': len(emails),
+        'baseline': {'backend': baseline_backend, 'seconds': baseline_time},
+        'candidates': []
+    }
+    for backend in candidate_backends:
+        outputs, elapsed = run_backend(backend, emails)
+        diffs, max_confidence_delta = compare_backends(baseline, outputs)
+        routing_changes = {d['filename'] for d in diffs if d['field'] in ('team', 'priority')}
+        report['candidates'].append({
+            'backend': backend,
+            'seconds': elapsed,
+            'speedup': baseline_time / elapsed if elapsed else None,
+            'routing_changes': len(routing_changes),
+            'max_confidence_delta': max_confidence_delta,
+            'diffs': diffs
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare inference backends against the fp32 baseline.")
+    parser.add_argument("--directory", default=EMAIL_DIR)
+    parser.add_argument("--baseline", default="pytorch")
+    parser.add_argument("--backends", nargs="+", default=["quantized", "onnx"])
+    parser.add_argument("--output", default=REPORT_FILE)
+    args = parser.parse_args()
+
+    report = build_report(args.directory, args.baseline, args.backends)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+
+    print(f"Baseline {report['baseline']['backend']}: {report['baseline']['seconds']:.2f}s over {report['emails']} emails")
+    for candidate in report['candidates']:
+        print(f"{candidate['backend']}: {candidate['seconds']:.2f}s ({candidate['speedup']:.2f}x), "
+              f"{candidate['routing_changes']} routing changes, {len(candidate['diffs'])} field diffs, "
+              f"max confidence delta {candidate['max_confidence_delta']:.4f}")
+    sys.exit(1 if any(c['routing_changes'] for c in report['candidates']) else 0)
@@ -0,0 +1,14 @@
+def token_budget_batches(lengths, max_batch_size, max_batch_tokens):
+    """Groups indices, shortest first, so each batch holds at most max_batch_size items and items x longest <= max_batch_tokens."""
+    # An item longer than max_batch_tokens on its own still gets a batch of one
+    batches, batch, longest = [], [], 0
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        longest_with_i = max(longest, lengths[i])
+        if batch and (len(batch) >= max_batch_size or (len(batch) + 1) * longest_with_i > max_batch_tokens):
+            batches.append(batch)
+            batch, longest_with_i = [], lengths[i]
+        batch.append(i)
+        longest = longest_with_i
+    if batch:
+        batches.append(batch)
+    return batches
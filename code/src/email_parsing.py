@@ -0,0 +1,152 @@
+import os
+import logging
+from email import policy
+from email.parser import BytesParser
+
+logger = logging.getLogger(__name__)
+
+# Tried in order when a text part has no charset, an unknown one, or bytes that do not fit it
+DECODE_FALLBACK_CHARSETS = ('utf-8', 'cp1252')
+
+# Per-run totals, aggregated from each record's decode_stats in the process that consumes them
+DECODE_STATS = {'parts': 0, 'fallback': 0, 'replaced': 0}
+
+
+def decode_text_part(part, stats):
+    """Decodes a text part with its declared charset, falling back to DECODE_FALLBACK_CHARSETS.
+
+    stats counts the parts decoded, the ones the first choice (the declared charset, or
+    UTF-8 when none is declared) could not decode, and the ones that only decoded with
+    replacement characters.
+    """
+    payload = part.get_payload(decode=True) or b""
+    stats['parts'] += 1
+    charset = part.get_content_charset()
+    candidates = [charset] if charset else []
+    candidates += [fallback for fallback in DECODE_FALLBACK_CHARSETS if fallback != charset]
+    for attempt, candidate in enumerate(candidates):
+        try:
+            text = payload.decode(candidate)
+        except (LookupError, UnicodeDecodeError):
+            continue
+        if attempt:
+            stats['fallback'] += 1
+        return text
+    stats['fallback'] += 1
+    stats['replaced'] += 1
+    logger.warning(f"Undecodable text part (charset {charset}); replacing invalid bytes")
+    return payload.decode('utf-8', errors='replace')
+
+
+def load_message(source):
+    """Parses a message from an .eml path or from raw message bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return BytesParser(policy=policy.default).parsebytes(source)
+    with open(source, 'rb') as f:
+        return BytesParser(policy=policy.default).parse(f)
+
+
+class LazyAttachment:
+    """Handle to an attachment part; its payload is decoded only when read() is called.
+
+    source is the .eml path or the raw message bytes, index the part's position in
+    msg.walk() and size the length of its transfer-encoded payload. Pickling a handle
+    built from a path carries only these fields; one built from raw bytes is pickled with
+    just its decoded part, never the whole message.
+    """
+    __slots__ = ('name', 'content_type', 'size', 'source', 'index')
+
+    def __init__(self, name, content_type, size, source, index):
+        self.name = name
+        self.content_type = content_type
+        self.size = size
+        self.source = source
+        self.index = index
+
+    def read(self, msg=None):
+        """Decoded payload bytes; pass the already-parsed msg to avoid parsing the source again."""
+        if self.index is None:
+            # Detached handle: source already is the decoded payload
+            return self.source
+        for i, part in enumerate((msg or load_message(self.source)).walk()):
+            if i == self.index:
+                return part.get_payload(decode=True)
+        raise LookupError(f"Attachment {self.name} not found at part {self.index}")
+
+    def __getstate__(self):
+        source, index = self.source, self.index
+        if isinstance(source, (bytes, bytearray)) and index is not None:
+            source, index = self.read(), None
+        return self.name, self.content_type, self.size, source, index
+
+    def __setstate__(self, state):
+        self.name, self.content_type, self.size, self.source, self.index = state
+
+    def __repr__(self):
+        return f"LazyAttachment({self.name!r}, {self.content_type!r}, size={self.size})"
+
+
+def record_decode_stats(email_data):
+    for key, count in email_data.get('decode_stats', {}).items():
+        DECODE_STATS[key] = DECODE_STATS.get(key, 0) + count
+
+
+def parse_email_message(msg, filename, source):
+    """Builds the email_data record from a parsed message.
+
+    Attachments are LazyAttachment handles into source (the .eml path or raw bytes the
+    message was parsed from), so their payloads are never decoded here.
+    """
+    subject = msg['subject'] or ""
+    body = ""
+    attachments = []
+    from_address = msg['From'] or ""
+    decode_stats = {'parts': 0, 'fallback': 0, 'replaced': 0}
+
+    for index, part in enumerate(msg.walk()):
+        if part.get_content_type() == 'text/plain':
+            body += decode_text_part(part, decode_stats)
+        elif not part.get_content_type().startswith('multipart'):
+            attachment_name = part.get_filename()
+            if attachment_name:
+                payload = part.get_payload()
+                size = len(payload) if isinstance(payload, (str, bytes)) else None
+                attachments.append(LazyAttachment(attachment_name, part.get_content_type(), size, source, index))
+                logger.info(f"Attachment found: {attachment_name}")
+
+    return {
+        'filename': filename,
+        'subject': subject,
+        # Normalise CRLF so the email hash does not depend on how the file was transferred
+        'body': body.replace('\r\n', '\n'),
+        'attachments': attachments,
+        'from_address': from_address,
+        'decode_stats': decode_stats
+    }
+
+
+# Step 1: Extract email components
+def extract_email_components(filepath):
+    logger.info(f"Extracting components from email: {filepath}")
+    try:
+        # Bytes mode: each part is decoded with its own charset rather than the file as UTF-8
+        msg = load_message(filepath)
+        email_data = parse_email_message(msg, os.path.basename(filepath), filepath)
+        logger.info(f"Email components extracted: {email_data['filename']}")
+        return email_data
+    except Exception as e:
+        logger.error(f"Error extracting email components from {filepath}: {str(e)}")
+        return None
+
+
+def extract_email_components_from_bytes(raw, filename):
+    """Parses a message held in memory (e.g. an upload); attachment handles keep a reference to raw."""
+    logger.info(f"Extracting components from email bytes: {filename}")
+    try:
+        msg = load_message(raw)
+        email_data = parse_email_message(msg, filename, raw)
+        logger.info(f"Email components extracted: {email_data['filename']}")
+        return email_data
+    except Exception as e:
+        logger.error(f"Error extracting email components from {filename}: {str(e)}")
+        return None
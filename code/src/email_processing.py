@@ -1,16 +1,32 @@
 import os
-import email
-from email import policy
 import re
+import shutil
 import json
 import hashlib
 import logging
-from flask import Flask, request, render_template, redirect, url_for, flash, jsonify
-import jaydebeapi
-from transformers import pipeline
-from multiprocessing import Pool
+import time
+import atexit
+import threading
+import queue
+from collections import deque
+from flask import Flask, request, render_template, redirect, url_for, flash, jsonify, Response, stream_with_context
+from werkzeug.utils import secure_filename
+import torch
+from transformers import pipeline, AutoTokenizer, AutoModel
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import yaml
+from email_parsing import (extract_email_components, extract_email_components_from_bytes,
+                           record_decode_stats, DECODE_STATS)
+from attachment_extraction import iter_with_attachment_text, ATTACHMENT_TEXT_MAX_CHARS
+from inference_cache import InferenceCache
+from batching import token_budget_batches
+from manifest import load_manifest, save_manifest, select_changed_files
+from storage import get_storage, EmailBatchWriter, STORE_FLUSH_INTERVAL
+from results_sink import ResultSink, RESULTS_FILE
+from audit_log import AuditLogWriter, AUDIT_LOG_FILE
+from jobs import JobStore, JobRunner, JOBS_DIR
+from worker_pools import create_process_pool
 
 # Set up logging
 logging.basicConfig(
@@ -24,8 +40,16 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Read keywords from YML file
-with open('keywords.yml', 'r') as f:
-    data = yaml.load(f, Loader=yaml.FullLoader)
+KEYWORDS_FILE = 'keywords.yml'
+
+def load_keywords(path=KEYWORDS_FILE):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    data = yaml.load(raw, Loader=yaml.FullLoader)
+    return data, hashlib.md5(raw).hexdigest()
+
+data, KEYWORDS_DIGEST = load_keywords()
+KEYWORDS_MTIME = os.path.getmtime(KEYWORDS_FILE)
 REQUEST_TYPES = list(data.keys())
 SUB_REQUEST_TYPES = data
 
@@ -71,6 +95,30 @@ PRIORITY_RULES = {
     "Foreign Currency": 2  # Foreign transactions require attention but not always urgent
 }
 
+# Classification settings
+# Both NLI modes score every request type, then only the winning type's sub-types
+# (at most 29 pairs per email with the current keywords.yml, not all 188 hypotheses).
+# "sequential" makes one second-level call per predicted type; "hierarchical" flattens
+# the second level of the whole batch into a single call.
+CLASSIFICATION_MODE = "sequential"
+HYPOTHESIS_TEMPLATE = "This example is {}."
+# NLI forwards are cut by padded size: pairs are sorted by length and grouped until
+# pairs x longest pair would exceed NLI_MAX_BATCH_TOKENS (or NLI_BATCH_SIZE pairs),
+# which bounds activation memory when long premises (attachment text) are in the batch
+NLI_BATCH_SIZE = 32
+NLI_MAX_BATCH_TOKENS = 4096
+
+# Cross-email inference batching: flush after this many parsed emails or seconds
+INFERENCE_BATCH_SIZE = 16
+INFERENCE_BATCH_TIMEOUT = 2.0
+
+# "embedding" mode: decide with a small sentence encoder against keywords.yml phrases and
+# escalate to the NLI classifier (EMBEDDING_FALLBACK_MODE) when the top-2 margin is too small
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_MARGIN_THRESHOLD = 0.05
+EMBEDDING_TEMPERATURE = 0.05
+EMBEDDING_FALLBACK_MODE = "sequential"
+
 # Flask app setup
 app = Flask(__name__, template_folder='templates')
 app.secret_key = "your-secret-key"  # Required for flash messages
@@ -89,67 +137,376 @@ def method_not_allowed(e):
     flash("Please use the upload form to submit files.", "error")
     return redirect(url_for('upload_page'))
 
-# Load Hugging Face models in the main process
-logger.info("Loading Hugging Face models...")
-CLASSIFIER = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
-NER = pipeline("ner", model="dslim/bert-base-NER")
-logger.info("Models loaded successfully.")
+# Persistent inference result cache keyed on the email hash (see inference_cache.py)
+INFERENCE_CACHE_ENABLED = True
+INFERENCE_CACHE_FILE = "inference_cache.db"
+INFERENCE_CACHE_MAX_ENTRIES = 10000
+
+# Inference backend for the classifier and NER pipelines: "pytorch" (fp32),
+# "quantized" (dynamic int8 on Linear layers) or "onnx" (ONNX Runtime via optimum)
+INFERENCE_BACKEND = "pytorch"
+# The "onnx" backend exports each model once and loads the saved export from here afterwards
+ONNX_CACHE_DIR = "onnx_models"
+
+# Hugging Face models are loaded lazily, on first use, so importing this module
+# (Flask reloads, spawned Pool children, tests) does not pay for them
+CLASSIFIER_MODEL = "facebook/bart-large-mnli"
+NER_MODEL = "dslim/bert-base-NER"
+
+class ModelRegistry:
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                # Re-check under the lock so concurrent callers load each model only once
+                model = self._models.get(name)
+                if model is None:
+                    logger.info(f"Loading model: {name}")
+                    model = self._loaders[name]()
+                    self._models[name] = model
+                    logger.info(f"Model loaded: {name}")
+        return model
 
-# Step 1: Extract email components
-def extract_email_components(filepath):
-    logger.info(f"Extracting components from email: {filepath}")
+    def is_loaded(self, name):
+        return name in self._models
+
+    def unload(self, names=None):
+        with self._lock:
+            for name in names or list(self._models):
+                self._models.pop(name, None)
+
+    def warm_up(self, names=None):
+        for name in names or list(self._loaders):
+            self.get(name)
+
+def load_pipeline(task, model_name):
+    # Every backend returns a transformers pipeline, so callers see the same output dicts
+    logger.info(f"Building {task} pipeline for {model_name} with backend: {INFERENCE_BACKEND}")
+    if INFERENCE_BACKEND == "onnx":
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTModelForTokenClassification
+        model_class = ORTModelForTokenClassification if task == "ner" else ORTModelForSequenceClassification
+        model = load_onnx_model(model_class, model_name)
+        return pipeline(task, model=model, tokenizer=AutoTokenizer.from_pretrained(model_name))
+
+    nlp = pipeline(task, model=model_name)
+    if INFERENCE_BACKEND == "quantized":
+        nlp.model = torch.quantization.quantize_dynamic(nlp.model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif INFERENCE_BACKEND != "pytorch":
+        raise ValueError(f"Unknown inference backend: {INFERENCE_BACKEND}")
+    return nlp
+
+def load_onnx_model(model_class, model_name):
+    model_dir = os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "--"))
+    if os.path.isdir(model_dir):
+        return model_class.from_pretrained(model_dir)
+    logger.info(f"Exporting {model_name} to ONNX in {model_dir}")
+    model = model_class.from_pretrained(model_name, export=True)
+    # Saved under a temporary name and renamed, so another process never loads a partial export
+    tmp_dir = f"{model_dir}.tmp-{os.getpid()}"
+    model.save_pretrained(tmp_dir)
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            msg = email.message_from_file(f, policy=policy.default)
-            subject = msg['subject'] or ""
-            body = ""
-            attachments = []
-            from_address = msg['From'] or ""
-
-            for part in msg.walk():
-                if part.get_content_type() == 'text/plain':
-                    body += part.get_payload(decode=True).decode()
-                elif not part.get_content_type().startswith('multipart'):
-                    attachment_name = part.get_filename()
-                    if attachment_name:
-                        attachments.append((attachment_name, part.get_payload(decode=True)))
-                        logger.info(f"Attachment found: {attachment_name}")
-
-            email_data = {
-                'filename': os.path.basename(filepath),
-                'subject': subject,
-                'body': body,
-                'attachments': attachments,
-                'from_address': from_address
-            }
-            logger.info(f"Email components extracted: {email_data['filename']}")
-            return email_data
-    except Exception as e:
-        logger.error(f"Error extracting email components from {filepath}: {str(e)}")
-        return None
+        os.rename(tmp_dir, model_dir)
+    except OSError:
+        # Another process finished its export first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return model
+
+def load_embedder():
+    model = AutoModel.from_pretrained(EMBEDDING_MODEL)
+    model.eval()
+    return AutoTokenizer.from_pretrained(EMBEDDING_MODEL), model
+
+MODELS = ModelRegistry()
+MODELS.register("classifier", lambda: load_pipeline("zero-shot-classification", CLASSIFIER_MODEL))
+MODELS.register("ner", lambda: load_pipeline("ner", NER_MODEL))
+MODELS.register("embedder", load_embedder)
+
+def get_classifier():
+    return MODELS.get("classifier")
+
+def get_ner():
+    return MODELS.get("ner")
+
+def get_embedder():
+    return MODELS.get("embedder")
+
+def set_inference_backend(backend):
+    """Switches INFERENCE_BACKEND; the classifier and NER pipelines are rebuilt on next use."""
+    global INFERENCE_BACKEND
+    INFERENCE_BACKEND = backend
+    MODELS.unload(["classifier", "ner"])
+    HYPOTHESIS_CACHE.clear()
+
+def warm_up_models():
+    """Loads every model the current CLASSIFICATION_MODE needs, so the first request is not slow."""
+    logger.info("Warming up Hugging Face models...")
+    names = ["classifier", "ner"]
+    if CLASSIFICATION_MODE == "embedding":
+        names.append("embedder")
+    MODELS.warm_up(names)
+    build_hypothesis_cache()
+    if CLASSIFICATION_MODE == "embedding":
+        get_label_embeddings()
+    logger.info("Models loaded successfully.")
+
+# Step 1: Extract email components (see email_parsing.py)
 
 # Step 2: Classify email intent using Hugging Face (in main process)
-def classify_email_intent(email_data):
-    logger.info(f"Classifying intent for email: {email_data['filename']}")
+def parse_labels(labels):
+    # keywords.yml stores sub-types as comma-joined strings, like the zero-shot pipeline accepts
+    if isinstance(labels, str):
+        labels = labels.split(",")
+    return [label.strip() for label in labels if label.strip()]
+
+def get_entailment_id(model):
+    for label, idx in model.config.label2id.items():
+        if label.lower().startswith("entail"):
+            return idx
+    return -1
+
+# Tokenized "This example is {label}." hypotheses, built once per keywords.yml version
+HYPOTHESIS_CACHE = {}
+
+def refresh_label_config():
+    """Reloads keywords.yml and drops cached hypothesis encodings, but only if the file changed."""
+    global data, KEYWORDS_DIGEST, KEYWORDS_MTIME, REQUEST_TYPES, SUB_REQUEST_TYPES, LABEL_EMBEDDINGS
     try:
-        text = email_data['subject'] + " " + email_data['body']
-        result = CLASSIFIER(text, candidate_labels=REQUEST_TYPES)
-        request_type = result['labels'][0]
-        confidence = result['scores'][0]
+        mtime = os.path.getmtime(KEYWORDS_FILE)
+        if mtime == KEYWORDS_MTIME:
+            return
+        new_data, digest = load_keywords()
+        KEYWORDS_MTIME = mtime
+        if digest == KEYWORDS_DIGEST:
+            return
+        logger.info("keywords.yml changed, reloading labels and hypothesis encodings.")
+        data, KEYWORDS_DIGEST = new_data, digest
+        REQUEST_TYPES = list(data.keys())
+        SUB_REQUEST_TYPES = data
+        LABEL_EMBEDDINGS = None
+        if MODELS.is_loaded("classifier"):
+            build_hypothesis_cache()
+        else:
+            HYPOTHESIS_CACHE.clear()
+    except Exception as e:
+        logger.error(f"Error reloading {KEYWORDS_FILE}: {str(e)}")
+
+def build_hypothesis_cache():
+    HYPOTHESIS_CACHE.clear()
+    labels = list(REQUEST_TYPES)
+    for sub_types in SUB_REQUEST_TYPES.values():
+        labels.extend(parse_labels(sub_types or []))
+    for label in labels:
+        get_hypothesis_ids(label)
+    logger.info(f"Cached hypothesis encodings for {len(HYPOTHESIS_CACHE)} labels.")
+
+def get_hypothesis_ids(label):
+    ids = HYPOTHESIS_CACHE.get(label)
+    if ids is None:
+        ids = get_classifier().tokenizer.encode(HYPOTHESIS_TEMPLATE.format(label), add_special_tokens=False)
+        HYPOTHESIS_CACHE[label] = ids
+    return ids
+
+def encode_hypothesis_pairs(pairs):
+    # Each premise is tokenized once per call and joined with the cached hypothesis ids,
+    # truncating the premise the same way truncation="only_first" would.
+    tokenizer = get_classifier().tokenizer
+    max_length = tokenizer.model_max_length
+    num_special = tokenizer.num_special_tokens_to_add(pair=True)
+    premise_ids = {}
+    features = []
+    for premise, label in pairs:
+        if premise not in premise_ids:
+            premise_ids[premise] = tokenizer.encode(premise, add_special_tokens=False)
+        hypothesis_ids = get_hypothesis_ids(label)
+        ids = premise_ids[premise][:max(0, max_length - num_special - len(hypothesis_ids))]
+        features.append({'input_ids': tokenizer.build_inputs_with_special_tokens(ids, hypothesis_ids)})
+    return features
+
+def score_hypothesis_pairs(pairs):
+    """Returns the entailment logit for each (premise, label) pair, batched through the NLI model."""
+    classifier = get_classifier()
+    tokenizer = classifier.tokenizer
+    model = classifier.model
+    entailment_id = get_entailment_id(model)
+    features = encode_hypothesis_pairs(pairs)
+    entailment_logits = torch.empty(len(features))
+    lengths = [len(feature['input_ids']) for feature in features]
+    for batch in token_budget_batches(lengths, NLI_BATCH_SIZE, NLI_MAX_BATCH_TOKENS):
+        inputs = tokenizer.pad([features[i] for i in batch], return_tensors="pt").to(model.device)
+        with torch.no_grad():
+            logits = model(**inputs).logits
+        entailment_logits[batch] = logits[:, entailment_id].float().cpu()
+    return entailment_logits
 
+def zero_shot(texts, candidate_labels):
+    """Drop-in for classifier(texts, candidate_labels=...) that reuses the cached hypothesis encodings."""
+    labels = parse_labels(candidate_labels)
+    pairs = [(text, label) for text in texts for label in labels]
+    entailment_logits = score_hypothesis_pairs(pairs)
+    results = []
+    for i, text in enumerate(texts):
+        ranked, scores = rank_labels(labels, entailment_logits[i * len(labels):(i + 1) * len(labels)])
+        results.append({'sequence': text, 'labels': ranked, 'scores': scores})
+    return results
+
+def rank_labels(labels, entailment_logits):
+    # Same normalisation as the zero-shot pipeline: softmax over the label set
+    scores = torch.softmax(entailment_logits, dim=0).tolist()
+    ranked = sorted(zip(labels, scores), key=lambda x: x[1], reverse=True)
+    return [label for label, _ in ranked], [score for _, score in ranked]
+
+def as_result_list(result):
+    # Pipelines unwrap single-item inputs, so normalise back to one result per input
+    if isinstance(result, dict):
+        return [result]
+    return list(result)
+
+def classify_sequential(texts):
+    results = zero_shot(texts, REQUEST_TYPES)
+    classified = [(result['labels'][0], result['scores'][0], None, 0.0) for result in results]
+
+    # Second level: one call per predicted request type, covering every text that landed on it
+    by_type = {}
+    for i, (request_type, _, _, _) in enumerate(classified):
+        by_type.setdefault(request_type, []).append(i)
+    for request_type, indices in by_type.items():
         sub_types = SUB_REQUEST_TYPES.get(request_type,[])
+        if not sub_types:
+            continue
+        sub_results = zero_shot([texts[i] for i in indices], sub_types)
+        for i, sub_result in zip(indices, sub_results):
+            request_type, confidence, _, _ = classified[i]
+            classified[i] = (request_type, confidence, sub_result['labels'][0], sub_result['scores'][0])
+    return classified
+
+def classify_hierarchical(texts):
+    # Same pairs as sequential (request types, then only the winning type's sub-types),
+    # but every text's second level goes into one flattened scoring call instead of one
+    # zero-shot call per predicted type.
+    results = zero_shot(texts, REQUEST_TYPES)
+    classified = [(result['labels'][0], result['scores'][0], None, 0.0) for result in results]
+
+    sub_labels = [parse_labels(SUB_REQUEST_TYPES.get(request_type) or []) for request_type, _, _, _ in classified]
+    pairs = [(text, label) for text, labels in zip(texts, sub_labels) for label in labels]
+    entailment_logits = score_hypothesis_pairs(pairs)
+    start = 0
+    for i, labels in enumerate(sub_labels):
+        if not labels:
+            continue
+        sub_ranked, sub_scores = rank_labels(labels, entailment_logits[start:start + len(labels)])
+        start += len(labels)
+        request_type, confidence, _, _ = classified[i]
+        classified[i] = (request_type, confidence, sub_ranked[0], sub_scores[0])
+    return classified
+
+# Embedding fast path: the sentence encoder is only loaded if "embedding" mode is used
+LABEL_EMBEDDINGS = None
+FAST_PATH_STATS = {'embedding': 0, 'nli': 0}
+
+def embed_texts(texts):
+    """Mean-pooled, L2-normalised sentence embeddings."""
+    tokenizer, model = get_embedder()
+    embeddings = []
+    for start in range(0, len(texts), NLI_BATCH_SIZE):
+        inputs = tokenizer(texts[start:start + NLI_BATCH_SIZE], padding=True, truncation=True,
+                           return_tensors="pt").to(model.device)
+        with torch.no_grad():
+            hidden = model(**inputs).last_hidden_state
+        mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        embeddings.append(torch.nn.functional.normalize(pooled, dim=-1).cpu())
+    return torch.cat(embeddings)
+
+def get_label_embeddings():
+    # One row per request type name and per keyword phrase; rebuilt when keywords.yml changes
+    global LABEL_EMBEDDINGS
+    if LABEL_EMBEDDINGS is None:
+        phrases = []
+        type_rows = {}
+        for request_type in REQUEST_TYPES:
+            name_row = len(phrases)
+            phrases.append(request_type)
+            sub_types = parse_labels(SUB_REQUEST_TYPES.get(request_type) or [])
+            type_rows[request_type] = (name_row, list(range(len(phrases), len(phrases) + len(sub_types))))
+            phrases.extend(sub_types)
+        LABEL_EMBEDDINGS = (phrases, type_rows, embed_texts(phrases))
+        logger.info(f"Embedded {len(phrases)} label phrases for the fast path.")
+    return LABEL_EMBEDDINGS
+
+def classify_fast_path(texts):
+    """Returns (classified, decided_by); texts with a low top-2 margin are escalated to NLI."""
+    phrases, type_rows, label_embeddings = get_label_embeddings()
+    similarities = embed_texts(texts) @ label_embeddings.T
+    classified = [None] * len(texts)
+    decided_by = ['embedding'] * len(texts)
+    escalate = []
+    for i, sims in enumerate(similarities):
+        # A type scores as its best-matching phrase (its own name or any keyword phrase)
+        type_scores = torch.stack([sims[[name_row] + sub_rows].max() for name_row, sub_rows in type_rows.values()])
+        top = torch.topk(type_scores, min(2, len(type_scores)))
+        margin = (top.values[0] - top.values[1]).item() if len(top.values) > 1 else float('inf')
+        if margin < EMBEDDING_MARGIN_THRESHOLD:
+            escalate.append(i)
+            continue
+
+        request_type = REQUEST_TYPES[top.indices[0].item()]
+        confidence = torch.softmax(type_scores / EMBEDDING_TEMPERATURE, dim=0)[top.indices[0]].item()
+        sub_rows = type_rows[request_type][1]
         sub_request_type, sub_confidence = None, 0.0
-        if sub_types:
-            sub_result = CLASSIFIER(text, candidate_labels=sub_types)
-            sub_request_type = sub_result['labels'][0]
-            sub_confidence = sub_result['scores'][0]
+        if sub_rows:
+            sub_scores = torch.softmax(sims[sub_rows] / EMBEDDING_TEMPERATURE, dim=0)
+            best = sub_scores.argmax().item()
+            sub_request_type, sub_confidence = phrases[sub_rows[best]], sub_scores[best].item()
+        classified[i] = (request_type, confidence, sub_request_type, sub_confidence)
 
-        intent = {
-            'request_type': request_type,
-            'request_confidence': confidence,
-            'sub_request_type': sub_request_type,
-            'sub_request_confidence': sub_confidence
-        }
+    if escalate:
+        logger.info(f"Fast path margin below {EMBEDDING_MARGIN_THRESHOLD} for {len(escalate)} of {len(texts)} texts, escalating to NLI")
+        for i, result in zip(escalate, classify_nli([texts[i] for i in escalate], EMBEDDING_FALLBACK_MODE)):
+            classified[i] = result
+            decided_by[i] = 'nli'
+    return classified, decided_by
+
+def classify_nli(texts, mode):
+    if mode == "hierarchical":
+        return classify_hierarchical(texts)
+    return classify_sequential(texts)
+
+def classify_texts(texts):
+    refresh_label_config()
+    if CLASSIFICATION_MODE == "embedding":
+        classified, decided_by = classify_fast_path(texts)
+    else:
+        classified, decided_by = classify_nli(texts, CLASSIFICATION_MODE), ['nli'] * len(texts)
+    for path in decided_by:
+        FAST_PATH_STATS[path] += 1
+    return [{
+        'request_type': request_type,
+        'request_confidence': confidence,
+        'sub_request_type': sub_request_type,
+        'sub_request_confidence': sub_confidence,
+        'decided_by': path
+    } for (request_type, confidence, sub_request_type, sub_confidence), path in zip(classified, decided_by)]
+
+def classification_text(email_data):
+    # Subject and body, plus the (already truncated) attachment text when the attachment stage ran
+    text = email_data['subject'] + " " + email_data['body']
+    if email_data.get('attachment_text'):
+        text += "\n\n" + email_data['attachment_text']
+    return text
+
+def classify_email_intent(email_data):
+    logger.info(f"Classifying intent for email: {email_data['filename']}")
+    try:
+        text = classification_text(email_data)
+        intent = classify_texts([text])[0]
         logger.info(f"Intent classified: {intent}")
         return intent
     except Exception as e:
@@ -157,25 +514,29 @@ def classify_email_intent(email_data):
         return None
 
 # Step 3: Extract context of email using Hugging Face (in main process)
+def build_context(text, entities):
+    context = {'entities': []}
+    for entity in entities:
+        context['entities'].append({
+            'text': entity['word'],
+            'label': entity['entity']
+        })
+
+    amount_pattern = r"USD\s*[\d,]+\.\d{2}"
+    date_pattern = r"\d{1,2}-[A-Z]{3}-\d{4}"
+    amounts = re.findall(amount_pattern, text)
+    dates = re.findall(date_pattern, text)
+
+    context['amounts'] = amounts
+    context['dates'] = dates
+    return context
+
 def extract_context(email_data):
     logger.info(f"Extracting context for email: {email_data['filename']}")
     try:
-        text = email_data['subject'] + " " + email_data['body']
-        entities = NER(text)
-        context = {'entities': []}
-        for entity in entities:
-            context['entities'].append({
-                'text': entity['word'],
-                'label': entity['entity']
-            })
-
-        amount_pattern = r"USD\s*[\d,]+\.\d{2}"
-        date_pattern = r"\d{1,2}-[A-Z]{3}-\d{4}"
-        amounts = re.findall(amount_pattern, text)
-        dates = re.findall(date_pattern, text)
-
-        context['amounts'] = amounts
-        context['dates'] = dates
+        text = classification_text(email_data)
+        entities = get_ner()(text)
+        context = build_context(text, entities)
         logger.info(f"Context extracted: {context}")
         return context
     except Exception as e:
@@ -183,28 +544,160 @@ def extract_context(email_data):
         return None
 
 # Step 4: Handle multi-request emails (in main process)
+def split_segments(body):
+    return [segment for segment in body.split("\n\n") if segment.strip()]
+
+def build_segment_intents(segments, results):
+    intents = []
+    for segment, result in zip(segments, results):
+        intents.append({
+            'segment': segment,
+            'request_type': result['labels'][0],
+            'confidence': result['scores'][0]
+        })
+    primary_intent = max(intents, key=lambda x: x['confidence']) if intents else None
+    return primary_intent, intents
+
 def handle_multi_request(email_data):
     logger.info(f"Handling multi-request for email: {email_data['filename']}")
     try:
-        text = email_data['body']
-        segments = text.split("\n\n")
-        intents = []
-        for segment in segments:
-            if segment.strip():
-                result = CLASSIFIER(segment, candidate_labels=REQUEST_TYPES)
-                intents.append({
-                    'segment': segment,
-                    'request_type': result['labels'][0],
-                    'confidence': result['scores'][0]
-                })
-
-        primary_intent = max(intents, key=lambda x: x['confidence']) if intents else None
+        segments = split_segments(email_data['body'])
+        refresh_label_config()
+        results = zero_shot(segments, REQUEST_TYPES)
+        primary_intent, intents = build_segment_intents(segments, results)
         logger.info(f"Multi-request handled: Primary intent - {primary_intent}")
         return primary_intent, intents
     except Exception as e:
         logger.error(f"Error handling multi-request for {email_data['filename']}: {str(e)}")
         return None, []
 
+# Step 4b: Run steps 2-4 for a batch of emails with one batched forward per model
+def infer_single_email(filepath, email_data):
+    intent = classify_email_intent(email_data)
+    if not intent:
+        return None
+    context = extract_context(email_data)
+    if not context:
+        return None
+    primary_intent, all_intents = handle_multi_request(email_data)
+    return (filepath, email_data, intent, context, primary_intent, all_intents)
+
+def infer_email_batch(batch):
+    """Runs intent, context and multi-request inference for a list of (filepath, email_data) pairs."""
+    return [p for p in infer_email_batch_aligned(batch) if p is not None]
+
+def infer_email_batch_aligned(batch):
+    """infer_email_batch, but returns one entry per input in order, None where inference failed."""
+    logger.info(f"Running batched inference for {len(batch)} emails")
+    try:
+        texts = [classification_text(email_data) for _, email_data in batch]
+        intents = classify_texts(texts)
+        ner = get_ner()
+        entities = as_result_list(ner(texts, batch_size=INFERENCE_BATCH_SIZE)) if len(texts) > 1 else [ner(texts[0])]
+
+        # Flatten every email's segments into one classifier call and scatter the results back
+        segments = [split_segments(email_data['body']) for _, email_data in batch]
+        flat_segments = [segment for email_segments in segments for segment in email_segments]
+        flat_results = zero_shot(flat_segments, REQUEST_TYPES)
+
+        processed = []
+        offset = 0
+        for (filepath, email_data), text, intent, email_entities, email_segments in zip(batch, texts, intents, entities, segments):
+            results = flat_results[offset:offset + len(email_segments)]
+            offset += len(email_segments)
+            primary_intent, all_intents = build_segment_intents(email_segments, results)
+            processed.append((filepath, email_data, intent, build_context(text, email_entities), primary_intent, all_intents))
+        logger.info(f"Batched inference complete for {len(processed)} emails")
+        return processed
+    except Exception as e:
+        # Fall back to per-email inference so one bad email does not drop the whole batch
+        logger.error(f"Error in batched inference, falling back to per-email inference: {str(e)}")
+        return [infer_single_email(filepath, email_data) for filepath, email_data in batch]
+
+# Placeholder intent used when the pipeline runs without any model (hashing, DB and routing only)
+UNCLASSIFIED_INTENT = {
+    'request_type': "Unclassified",
+    'request_confidence': 0.0,
+    'sub_request_type': None,
+    'sub_request_confidence': 0.0,
+    'decided_by': None
+}
+
+def skip_inference_batch(batch):
+    """Same shape as infer_email_batch, but only the regex context is filled in and no model is loaded."""
+    processed = []
+    for filepath, email_data in batch:
+        text = classification_text(email_data)
+        processed.append((filepath, email_data, dict(UNCLASSIFIED_INTENT), build_context(text, []), None, []))
+    return processed
+
+INFERENCE_CACHE = None
+
+def get_inference_cache():
+    global INFERENCE_CACHE
+    if INFERENCE_CACHE is None:
+        INFERENCE_CACHE = InferenceCache(INFERENCE_CACHE_FILE, INFERENCE_CACHE_MAX_ENTRIES)
+    return INFERENCE_CACHE
+
+def inference_cache_version():
+    # Cached results are only valid for the same models, backend, mode, hypothesis template,
+    # embedding thresholds and keywords.yml
+    parts = [CLASSIFIER_MODEL, NER_MODEL, INFERENCE_BACKEND, CLASSIFICATION_MODE, KEYWORDS_DIGEST, HYPOTHESIS_TEMPLATE]
+    if CLASSIFICATION_MODE == "embedding":
+        parts += [EMBEDDING_MODEL, str(EMBEDDING_MARGIN_THRESHOLD), str(EMBEDDING_TEMPERATURE), EMBEDDING_FALLBACK_MODE]
+    if ATTACHMENT_EXTRACTION_ENABLED:
+        parts.append(f"attachments:{ATTACHMENT_TEXT_MAX_CHARS}")
+    return hashlib.md5("|".join(parts).encode()).hexdigest()
+
+def inference_cache_key(email_data):
+    # The email hash covers subject and body only; attachment text also changes the model input
+    email_hash = email_data.get('email_hash')
+    if email_hash and email_data.get('attachment_text'):
+        return hashlib.md5((email_hash + email_data['attachment_text']).encode()).hexdigest()
+    return email_hash
+
+def infer_email_batch_cached(batch):
+    """infer_email_batch, but emails already seen with the same hash and cache version skip inference."""
+    try:
+        refresh_label_config()
+        version = inference_cache_version()
+        cache = get_inference_cache()
+        cached = cache.get_many(version, [inference_cache_key(email_data) for _, email_data in batch if email_data.get('email_hash')])
+    except Exception as e:
+        logger.error(f"Error reading inference cache: {str(e)}")
+        return infer_email_batch(batch)
+
+    processed = [None] * len(batch)
+    misses = []
+    for i, (filepath, email_data) in enumerate(batch):
+        value = cached.get(inference_cache_key(email_data))
+        if value:
+            processed[i] = (filepath, email_data, value['intent'], value['context'], value['primary_intent'], value['all_intents'])
+        else:
+            misses.append(i)
+    logger.info(f"Inference cache: {len(batch) - len(misses)} hits, {len(misses)} misses")
+
+    if misses:
+        # Matched back by position: uploads can share a filename within one batch
+        aligned = infer_email_batch_aligned([batch[i] for i in misses])
+        for i, item in zip(misses, aligned):
+            processed[i] = item
+        inferred = [item for item in aligned if item is not None]
+        try:
+            cache.put_many(version, {
+                inference_cache_key(email_data): {
+                    'intent': intent,
+                    'context': context,
+                    'primary_intent': primary_intent,
+                    'all_intents': all_intents
+                }
+                for _, email_data, intent, context, primary_intent, all_intents in inferred
+                if email_data.get('email_hash')
+            })
+        except Exception as e:
+            logger.error(f"Error writing inference cache: {str(e)}")
+    return [p for p in processed if p is not None]
+
 # Step 5: Assign priority and confidence
 def assign_priority_and_confidence(intent, email_data):
     logger.info(f"Assigning priority for email: {email_data['filename']}")
@@ -220,7 +713,10 @@ def assign_priority_and_confidence(intent, email_data):
         scored_intent = {
             'request_type': request_type,
             'confidence': confidence,
-            'priority': priority
+            'priority': priority,
+            'sub_request_type': intent.get('sub_request_type'),
+            'sub_request_confidence': intent.get('sub_request_confidence', 0.0),
+            'decided_by': intent.get('decided_by')
         }
         logger.info(f"Priority assigned: {scored_intent}")
         return scored_intent
@@ -240,67 +736,18 @@ def compute_email_hash(email_data):
         logger.error(f"Error computing hash for {email_data['filename']}: {str(e)}")
         return None
 
-# Step 7: Set up H2 database
-def setup_h2_database():
-    logger.info("Setting up H2 database...")
-    try:
-        conn = jaydebeapi.connect(
-            "org.h2.Driver",
-            "jdbc:h2:./email_db",
-            ["sa", ""],
-            "h2latest.jar"
-        )
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS emails (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                filename VARCHAR(255),
-                request_type VARCHAR(255),
-                sub_request_type VARCHAR(255),
-                confidence FLOAT,
-                context TEXT,
-                email_hash VARCHAR(255),
-                email_from VARCHAR(255)
-            )
-        """)
-        logger.info("H2 database setup complete.")
-        return conn, cursor
-    except Exception as e:
-        logger.error(f"Error setting up H2 database: {str(e)}")
-        return None, None
-
-# Step 8: Detect duplicates
-def detect_duplicates(cursor, email_data, email_hash):
-    logger.info(f"Detecting duplicates for email: {email_data['filename']}")
-    try:
-        cursor.execute("SELECT COUNT(*) FROM emails WHERE email_hash = ? AND email_from = ?", (email_hash, email_data['from_address'],))
-        count = cursor.fetchone()[0]
-        is_duplicate = count > 0
-        logger.info(f"Duplicate check: {'Duplicate' if is_duplicate else 'Not a duplicate'}")
-        return is_duplicate
-    except Exception as e:
-        logger.error(f"Error detecting duplicates for {email_data['filename']}: {str(e)}")
-        return False
-
-# Step 9: Store email data in h2 database
-def store_email_data(cursor, email_data, intent, context, email_hash):
-    logger.info(f"Storing email data for: {email_data['filename']}")
-    try:
-        cursor.execute("""
-            INSERT INTO emails (filename, request_type, sub_request_type, confidence, context, email_hash, email_from)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            email_data['filename'],
-            intent['request_type'],
-            intent['sub_request_type'],
-            intent['request_confidence'],
-            str(context),
-            email_hash,
-            email_data['from_address']
-        ))
-        logger.info("Email data stored successfully.")
-    except Exception as e:
-        logger.error(f"Error storing email data for {email_data['filename']}: {str(e)}")
+# Steps 7-9: Set up the database, detect duplicates and store email data (backends and
+# EmailBatchWriter in storage.py)
+def build_email_row(email_data, intent, context, email_hash):
+    return (
+        email_data['filename'],
+        intent['request_type'],
+        intent['sub_request_type'],
+        intent['request_confidence'],
+        str(context),
+        email_hash,
+        email_data['from_address']
+    )
 
 # Step 10: Route request
 def route_request(result):
@@ -316,21 +763,96 @@ def route_request(result):
         return result
 
 # Step 11: Log classification decision for bias mitigation
+# Written by one queue-fed thread in the main process as JSON lines (see audit_log.py)
+AUDIT_LOG = None
+AUDIT_LOG_LOCK = threading.Lock()
+
+def get_audit_log():
+    global AUDIT_LOG
+    with AUDIT_LOG_LOCK:
+        if AUDIT_LOG is None:
+            AUDIT_LOG = AuditLogWriter(AUDIT_LOG_FILE)
+            atexit.register(AUDIT_LOG.close)
+        return AUDIT_LOG
+
+def model_version():
+    return {
+        'classifier': CLASSIFIER_MODEL,
+        'embedding': EMBEDDING_MODEL if CLASSIFICATION_MODE == "embedding" else None,
+        'backend': INFERENCE_BACKEND,
+        'mode': CLASSIFICATION_MODE,
+        'keywords_digest': KEYWORDS_DIGEST
+    }
+
 def log_classification_decision(result):
     logger.info(f"Logging classification decision for: {result['filename']}")
     try:
-        with open("classification_log.txt", "a") as f:
-            f.write(f"{datetime.now()} - Email: {result['filename']}, Intent: {result['intent']['request_type']}, Confidence: {result['intent']['request_confidence'] * 100:.2f}%\n")
-            if result['intent']['sub_request_type']:
-                f.write(f"Sub-Intent: {result['intent']['sub_request_type']}, Sub-Confidence: {result['intent']['sub_request_confidence'] * 100:.2f}%\n")
-            f.write("\n")
+        intent = result['intent']
+        get_audit_log().log({
+            'timestamp': datetime.now().isoformat(),
+            'filename': result['filename'],
+            'intent': intent['request_type'],
+            'confidence': intent['confidence'],
+            'sub_intent': intent.get('sub_request_type'),
+            'sub_confidence': intent.get('sub_request_confidence'),
+            'decided_by': intent.get('decided_by'),
+            'priority': intent.get('priority'),
+            'team': result.get('routing', {}).get('team'),
+            'is_duplicate': result.get('is_duplicate'),
+            'stored': result.get('stored'),
+            'model_version': model_version()
+        })
         logger.info("Classification decision logged.")
     except Exception as e:
         logger.error(f"Error logging classification decision for {result['filename']}: {str(e)}")
 
 # Step 12: Process a single email (without model loading)
+# Post-inference stage executor: "inline", "thread" or "process"; created once and reused across runs
+EXECUTOR_MODE = "inline"
+EXECUTOR_WORKERS = None
+# Only these email fields are handed to the stage, so attachment bytes are never pickled
+POST_PROCESS_FIELDS = ('filename', 'subject', 'body', 'from_address', 'email_hash')
+
+class InlineExecutor:
+    def map(self, fn, items, chunksize=1):
+        return map(fn, items)
+
+    def shutdown(self, wait=True):
+        pass
+
+POST_EXECUTOR = None
+POST_EXECUTOR_LOCK = threading.Lock()
+
+def get_post_executor():
+    global POST_EXECUTOR
+    with POST_EXECUTOR_LOCK:
+        if POST_EXECUTOR is None:
+            logger.info(f"Starting post-processing executor: {EXECUTOR_MODE}")
+            if EXECUTOR_MODE == "process":
+                POST_EXECUTOR = create_process_pool(EXECUTOR_WORKERS)
+            elif EXECUTOR_MODE == "thread":
+                POST_EXECUTOR = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="post-process")
+            else:
+                POST_EXECUTOR = InlineExecutor()
+        return POST_EXECUTOR
+
+def shutdown_post_executor():
+    global POST_EXECUTOR
+    with POST_EXECUTOR_LOCK:
+        if POST_EXECUTOR is not None:
+            POST_EXECUTOR.shutdown(wait=True)
+            POST_EXECUTOR = None
+
+atexit.register(shutdown_post_executor)
+
+def to_post_process_args(item):
+    filepath, email_data, intent, context, primary_intent, all_intents = item
+    fields = {key: email_data.get(key) for key in POST_PROCESS_FIELDS}
+    return filepath, fields, intent, context, all_intents
+
 def process_single_email(args):
-    filepath, email_data, intent, context, primary_intent, all_intents = args
+    """Returns (result, row); the row is persisted by EmailBatchWriter, which sets result['is_duplicate']."""
+    filepath, email_data, intent, context, all_intents = args
     logger.info(f"Processing email: {filepath}")
     try:
         # Assign priority and confidence
@@ -338,90 +860,361 @@ def process_single_email(args):
         if not scored_intent:
             return None
 
-        # Compute email hash
-        email_hash = compute_email_hash(email_data)
+        # Compute email hash (normally already done right after parsing)
+        email_hash = email_data.get('email_hash') or compute_email_hash(email_data)
         if not email_hash:
             return None
 
-        # Set up database
-        conn, cursor = setup_h2_database()
-        if not conn or not cursor:
-            return None
-
-        # Detect duplicates
-        is_duplicate = detect_duplicates(cursor, email_data, email_hash)
-
-        # Store in database
-        store_email_data(cursor, email_data, intent, context, email_hash)
-
         # Prepare result
         result = {
             'filename': email_data['filename'],
             'intent': scored_intent,
             'context': context,
-            'is_duplicate': is_duplicate,
+            'is_duplicate': False,
+            'stored': False,
             'all_intents': all_intents
         }
 
         # Route request
         result = route_request(result)
 
-        # Log classification decision
-        log_classification_decision(result)
-
-        conn.commit()
-        conn.close()
         logger.info(f"Email processed successfully: {filepath}")
-        return result
+        return result, build_email_row(email_data, intent, context, email_hash)
     except Exception as e:
         logger.error(f"Error processing email {filepath}: {str(e)}")
         return None
 
-# Step 13: Process email pipeline with parallel processing
-def process_email_pipeline(directory):
-    logger.info(f"Starting email processing pipeline for directory: {directory}")
-    try:
-        filepaths = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".eml")]
-        logger.info(f"Found {len(filepaths)} EML files to process.")
-
-        # Preprocess emails in the main process (model inference)
-        preprocessed_data = []
-        for filepath in filepaths:
-            # Extract email components
-            email_data = extract_email_components(filepath)
-            if not email_data:
-                continue
+# Step 13a: Track which files in a directory have already been processed (see manifest.py)
+MANIFEST_LOCK = threading.Lock()
 
-            # Classify intent
-            intent = classify_email_intent(email_data)
-            if not intent:
-                continue
+# Step 13: Process email pipeline as streaming stages
+# parse -> infer -> post-process -> persist -> emit, each stage a thread joined by bounded
+# queues, so memory stays O(batch) and rows reach the database while later files are parsed
+PIPELINE_QUEUE_SIZE = 8
+STAGE_DONE = object()
+
+def put_item(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def get_item(q, stop, timeout=None):
+    """Blocks until an item arrives; returns STAGE_DONE if the pipeline was stopped, raises queue.Empty on timeout."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not stop.is_set():
+        wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+        if wait <= 0:
+            raise queue.Empty
+        try:
+            return q.get(timeout=wait)
+        except queue.Empty:
+            continue
+    return STAGE_DONE
+
+def iter_queue_batches(q, stop, batch_size=None, max_wait=None):
+    """Groups queued items into batches of batch_size, flushing a partial batch once max_wait seconds have passed."""
+    batch_size = batch_size or INFERENCE_BATCH_SIZE
+    max_wait = INFERENCE_BATCH_TIMEOUT if max_wait is None else max_wait
+    done = False
+    while not done:
+        batch = []
+        deadline = None
+        while len(batch) < batch_size:
+            try:
+                item = get_item(q, stop, None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is STAGE_DONE:
+                done = True
+                break
+            if deadline is None:
+                deadline = time.monotonic() + max_wait
+            batch.append(item)
+        if batch:
+            yield batch
 
-            # Extract context
-            context = extract_context(email_data)
-            if not context:
+def start_stage(name, target, out_queue, stop, errors):
+    """Runs target on a thread; an exception is appended to errors and stops the whole pipeline."""
+    def run():
+        try:
+            target()
+        except Exception as e:
+            logger.error(f"Error in pipeline {name} stage: {str(e)}")
+            errors.append(e)
+            stop.set()
+        finally:
+            put_item(out_queue, STAGE_DONE, stop)
+    thread = threading.Thread(target=run, name=f"pipeline-{name}", daemon=True)
+    thread.start()
+    return thread
+
+RESULT_SINK = None
+RESULT_SINK_LOCK = threading.Lock()
+
+def get_result_sink():
+    global RESULT_SINK
+    with RESULT_SINK_LOCK:
+        if RESULT_SINK is None:
+            RESULT_SINK = ResultSink(RESULTS_FILE)
+        return RESULT_SINK
+
+def emit_results(results):
+    # Each result is appended to the NDJSON sink and the audit log the moment it is stored
+    sink = get_result_sink()
+    for result in results:
+        try:
+            sink.write(result)
+        except Exception as e:
+            logger.error(f"Error writing result for {result['filename']} to {RESULTS_FILE}: {str(e)}")
+        # Log classification decision
+        log_classification_decision(result)
+    return results
+
+# Parse workers: a long-lived process pool so MIME decoding overlaps with inference.
+# Attachments come back as LazyAttachment handles, so records stay small to pickle.
+PARSE_WORKERS = min(4, os.cpu_count() or 1)
+PARSE_EXECUTOR = None
+PARSE_EXECUTOR_LOCK = threading.Lock()
+
+def get_parse_executor():
+    global PARSE_EXECUTOR
+    with PARSE_EXECUTOR_LOCK:
+        if PARSE_EXECUTOR is None:
+            logger.info(f"Starting {PARSE_WORKERS} parse workers")
+            PARSE_EXECUTOR = create_process_pool(PARSE_WORKERS)
+            atexit.register(PARSE_EXECUTOR.shutdown)
+        return PARSE_EXECUTOR
+
+def iter_parsed(parse, sources):
+    """Yields (source, parse(*args)) for each (source, args) in order, keeping a bounded window in flight on the parse workers."""
+    if not PARSE_WORKERS:
+        for source, args in sources:
+            yield source, parse(*args)
+        return
+    executor = get_parse_executor()
+    window = deque()
+    for source, args in sources:
+        window.append((source, executor.submit(parse, *args)))
+        if len(window) >= PARSE_WORKERS * 4:
+            source, future = window.popleft()
+            yield source, future.result()
+    while window:
+        source, future = window.popleft()
+        yield source, future.result()
+
+def iter_parsed_files(filepaths):
+    return iter_parsed(extract_email_components, ((filepath, (filepath,)) for filepath in filepaths))
+
+def iter_parsed_uploads(uploads):
+    return iter_parsed(extract_email_components_from_bytes, ((filename, (raw, filename)) for filename, raw in uploads))
+
+# Attachment text from PDF/DOCX/DOC/TXT attachments is added to the classification input,
+# extracted on the attachment workers (see attachment_extraction.py)
+ATTACHMENT_EXTRACTION_ENABLED = True
+
+def run_pipeline_stages(parsed_emails, run_inference=True, batch_size=None, batch_timeout=None,
+                        flush_interval=STORE_FLUSH_INTERVAL):
+    """Runs parsed (source, email_data) pairs through infer -> post-process -> persist -> emit, yielding each stored result."""
+    # batch_size, batch_timeout and flush_interval override the inference batching and storage flush defaults
+    if not run_inference:
+        infer_batch = skip_inference_batch
+    elif INFERENCE_CACHE_ENABLED:
+        infer_batch = infer_email_batch_cached
+    else:
+        infer_batch = infer_email_batch
+
+    stop = threading.Event()
+    errors = []
+    parsed_queue = queue.Queue(PIPELINE_QUEUE_SIZE * INFERENCE_BATCH_SIZE)
+    inferred_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+    processed_queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+
+    def parse_stage():
+        # Attachment text is extracted here so it is part of the classification input
+        if ATTACHMENT_EXTRACTION_ENABLED:
+            parsed_emails_with_text = iter_with_attachment_text(parsed_emails)
+        else:
+            parsed_emails_with_text = parsed_emails
+        for source, email_data in parsed_emails_with_text:
+            if email_data:
+                record_decode_stats(email_data)
+                # Hash up front: it keys the inference cache as well as duplicate detection
+                email_data['email_hash'] = compute_email_hash(email_data)
+                if not put_item(parsed_queue, (source, email_data), stop):
+                    return
+
+    def infer_stage():
+        # Batched model inference
+        for batch in iter_queue_batches(parsed_queue, stop, batch_size, batch_timeout):
+            if not put_item(inferred_queue, infer_batch(batch), stop):
+                return
+
+    def post_process_stage():
+        # Run the remaining steps on the shared executor
+        executor = get_post_executor()
+        while True:
+            batch = get_item(inferred_queue, stop)
+            if batch is STAGE_DONE:
+                return
+            chunksize = max(1, len(batch) // 4) if EXECUTOR_MODE == "process" else 1
+            processed = list(executor.map(process_single_email, map(to_post_process_args, batch), chunksize=chunksize))
+            if not put_item(processed_queue, processed, stop):
+                return
+
+    threads = [
+        start_stage("parse", parse_stage, parsed_queue, stop, errors),
+        start_stage("infer", infer_stage, inferred_queue, stop, errors),
+        start_stage("post-process", post_process_stage, processed_queue, stop, errors),
+    ]
+    # Persist and emit run in the consumer: results are yielded once their chunk is stored
+    writer = EmailBatchWriter(get_storage(), flush_interval=flush_interval)
+    try:
+        while True:
+            try:
+                processed = get_item(processed_queue, stop, writer.seconds_until_flush())
+            except queue.Empty:
+                yield from emit_results(writer.flush())
                 continue
+            if processed is STAGE_DONE:
+                break
+            for item in processed:
+                if item is None:
+                    continue
+                result, row = item
+                yield from emit_results(writer.add(row, result))
+        # Rows already handed over are still stored before a stage failure is raised
+        results, writer = writer.close(), None
+        yield from emit_results(results)
+        get_result_sink().flush()
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        if writer is not None:
+            # The consumer stopped early: buffered rows are still stored, written and audited,
+            # but not yielded
+            emit_results(writer.close())
+            get_result_sink().flush()
 
-            # Handle multi-request
-            primary_intent, all_intents = handle_multi_request(email_data)
+def iter_email_pipeline(directory, run_inference=True, force=False, on_selected=None, **stage_options):
+    """Yields routed results as soon as they are persisted, for the new or changed .eml files in directory."""
+    filepaths = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".eml")]
+    with MANIFEST_LOCK:
+        manifest = load_manifest(directory)
+        filepaths, manifest_entries = select_changed_files(filepaths, manifest, force)
+        save_manifest(directory, manifest)
+    logger.info(f"Found {len(filepaths)} new or changed EML files to process.")
+    # Lets a caller (e.g. a job) record how many files this run will process
+    if on_selected:
+        on_selected(len(filepaths))
+    if not filepaths:
+        return
 
-            preprocessed_data.append((filepath, email_data, intent, context, primary_intent, all_intents))
+    # Only files whose result was stored are recorded, so failed ones are retried next run
+    by_filename = {os.path.basename(filepath): filepath for filepath in filepaths}
+    stored = []
+    try:
+        for result in run_pipeline_stages(iter_parsed_files(filepaths), run_inference, **stage_options):
+            if result.get('stored'):
+                stored.append(by_filename[result['filename']])
+            yield result
+    finally:
+        with MANIFEST_LOCK:
+            manifest = load_manifest(directory)
+            manifest.update({filepath: manifest_entries[filepath] for filepath in stored})
+            save_manifest(directory, manifest)
 
-        # Parallelize the remaining steps
-        with Pool() as pool:
-            results = pool.map(process_single_email, preprocessed_data)
+def iter_uploaded_email_pipeline(uploads, run_inference=True, **stage_options):
+    """Same as iter_email_pipeline, for (filename, raw bytes) pairs from an upload."""
+    logger.info(f"Processing {len(uploads)} uploaded emails.")
+    yield from run_pipeline_stages(iter_parsed_uploads(uploads), run_inference, **stage_options)
 
-        results = [r for r in results if r is not None]
+def process_email_pipeline(directory, run_inference=True, force=False):
+    """Processes the .eml files in directory that are new or changed since the last run (all of them if force)."""
+    logger.info(f"Starting email processing pipeline for directory: {directory}")
+    try:
+        results = list(iter_email_pipeline(directory, run_inference, force))
         logger.info(f"Processed {len(results)} emails successfully.")
-
-        with open("results.json", "w") as f:
-            json.dump(results, f, indent=4)
-        logger.info("Results saved to results.json")
+        logger.info(f"Classification paths so far: {FAST_PATH_STATS}")
+        logger.info(f"Text part decoding so far: {DECODE_STATS}")
+        logger.info(f"Results appended to {RESULTS_FILE}")
         return results
     except Exception as e:
         logger.error(f"Error in email processing pipeline: {str(e)}")
         return []
 
+# Uploads are read into memory on the request thread and parsed on the parse workers as
+# part of the pipeline; raw bytes are archived off the request path
+RAW_UPLOAD_ARCHIVE = True
+ARCHIVE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-archive")
+
+def write_raw_upload(path, raw):
+    try:
+        with open(path, "wb") as f:
+            f.write(raw)
+        logger.info(f"Archived upload: {path}")
+    except Exception as e:
+        logger.error(f"Error archiving upload {path}: {str(e)}")
+
+def read_uploaded_emails(files):
+    uploads = []
+    for file in files:
+        if not file.filename.endswith('.eml'):
+            continue
+        filename = secure_filename(file.filename)
+        # Read once: the parse workers and the archive share these bytes
+        raw = file.stream.read()
+        if RAW_UPLOAD_ARCHIVE:
+            ARCHIVE_EXECUTOR.submit(write_raw_upload, os.path.join(UPLOAD_FOLDER, filename), raw)
+        uploads.append((filename, raw))
+        logger.info(f"Uploaded file: {filename}")
+    return uploads
+
+# Streaming upload responses: each routed result is sent as soon as it is stored
+STREAM_BATCH_SIZE = 4
+STREAM_BATCH_TIMEOUT = 0.25
+STREAM_FLUSH_INTERVAL = 0.25
+
+def summarize_result(result):
+    return {
+        'filename': result['filename'],
+        'intent': result['intent']['request_type'],
+        'priority': result['intent']['priority'],
+        'team': result.get('routing', {}).get('team'),
+        'is_duplicate': result['is_duplicate'],
+        'stored': result.get('stored')
+    }
+
+def stream_upload_results(uploads, fmt):
+    """Yields SSE events or NDJSON lines for each result, then a final done marker."""
+    count = 0
+    try:
+        for result in iter_uploaded_email_pipeline(uploads, batch_size=STREAM_BATCH_SIZE,
+                                                   batch_timeout=STREAM_BATCH_TIMEOUT, flush_interval=STREAM_FLUSH_INTERVAL):
+            count += 1
+            payload = json.dumps(summarize_result(result))
+            yield f"event: result\ndata: {payload}\n\n" if fmt == 'sse' else payload + "\n"
+        done = {'done': True, 'count': count}
+    except Exception as e:
+        logger.error(f"Error streaming upload results: {str(e)}")
+        done = {'done': True, 'count': count, 'error': str(e)}
+    payload = json.dumps(done)
+    yield f"event: done\ndata: {payload}\n\n" if fmt == 'sse' else payload + "\n"
+
+# Background upload jobs: /upload enqueues, /jobs/<id> reports progress and results
+def run_upload_job(params, uploads, set_total):
+    set_total(len(uploads))
+    return iter_uploaded_email_pipeline(uploads)
+
+JOB_STORE = JobStore(JOBS_DIR)
+JOB_RUNNER = JobRunner(JOB_STORE, run_upload_job)
+
 # Flask routes
 @ app.route('/')
 def upload_page():
@@ -443,18 +1236,56 @@ def upload_files():
             flash("No files selected. Please select at least one EML file to upload.", "error")
             return redirect(url_for('upload_page'))
 
-        for file in files:
-            if file.filename.endswith('.eml'):
-                file.save(os.path.join(UPLOAD_FOLDER, file.filename))
-                logger.info(f"Uploaded file: {file.filename}")
-        results = process_email_pipeline(UPLOAD_FOLDER)
-        logger.info("Upload and processing completed.")
-        return jsonify(results)
+        uploads = read_uploaded_emails(files)
+        mode = request.values.get('mode')
+        if mode is None and 'text/event-stream' in request.headers.get('Accept', ''):
+            mode = 'sse'
+        if mode in ('sse', 'ndjson'):
+            mimetype = 'text/event-stream' if mode == 'sse' else 'application/x-ndjson'
+            logger.info(f"Streaming upload results as {mode}")
+            return Response(stream_with_context(stream_upload_results(uploads, mode)), mimetype=mimetype,
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+        if mode == 'sync':
+            results = list(iter_uploaded_email_pipeline(uploads))
+            logger.info("Upload and processing completed.")
+            return jsonify(results)
+
+        job = JOB_RUNNER.submit({'files': [filename for filename, _ in uploads]}, uploads)
+        logger.info(f"Upload queued as job {job['id']}")
+        return jsonify({
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': url_for('job_status', job_id=job['id']),
+            'results_url': url_for('job_results', job_id=job['id'])
+        }), 202
     except Exception as e:
         logger.error(f"Error handling upload: {str(e)}")
         flash(f"Error processing files: {str(e)}", "error")
         return redirect(url_for('upload_page'))
 
+@ app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = JOB_STORE.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job: {job_id}"}), 404
+    return jsonify(job)
+
+@ app.route('/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    job = JOB_STORE.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job: {job_id}"}), 404
+    # Results stored so far; complete once status is "completed"
+    return jsonify({
+        'job_id': job_id,
+        'status': job['status'],
+        'results': JOB_STORE.results(job_id)
+    })
+
 if __name__ == "__main__":
     logger.info("Starting Flask application...")
+    # Skip the warm-up in the debug reloader's watcher process; only the serving child needs models
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        warm_up_models()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
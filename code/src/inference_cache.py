@@ -0,0 +1,68 @@
+import json
+import sqlite3
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceCache:
+    """Persistent, LRU-bounded cache of per-email inference results, keyed on (version, email hash)."""
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS inference_cache (
+                version TEXT,
+                email_hash TEXT,
+                value TEXT,
+                last_access REAL,
+                PRIMARY KEY (version, email_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_inference_cache_access ON inference_cache(last_access)")
+        self._conn.commit()
+
+    def get_many(self, version, email_hashes):
+        """Returns {email_hash: value} for the hashes present under this version."""
+        if not email_hashes:
+            return {}
+        placeholders = ",".join("?" * len(email_hashes))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT email_hash, value FROM inference_cache WHERE version = ? AND email_hash IN ({placeholders})",
+                (version, *email_hashes)
+            ).fetchall()
+            if rows:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE inference_cache SET last_access = ? WHERE version = ? AND email_hash = ?",
+                    [(now, version, email_hash) for email_hash, _ in rows]
+                )
+                self._conn.commit()
+        return {email_hash: json.loads(value) for email_hash, value in rows}
+
+    def put_many(self, version, items):
+        """Stores {email_hash: value} and evicts the least recently used entries beyond max_entries."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO inference_cache (version, email_hash, value, last_access) VALUES (?, ?, ?, ?)",
+                [(version, email_hash, json.dumps(value), now) for email_hash, value in items.items()]
+            )
+            self._conn.execute("""
+                DELETE FROM inference_cache WHERE rowid IN (
+                    SELECT rowid FROM inference_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
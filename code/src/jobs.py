@@ -0,0 +1,133 @@
+import os
+import json
+import uuid
+import queue
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = "jobs/"
+
+
+class JobStore:
+    """Local job store: one JSON status file and one NDJSON results file per job under jobs_dir."""
+
+    def __init__(self, jobs_dir=JOBS_DIR):
+        self.jobs_dir = jobs_dir
+        self._jobs = {}
+        self._lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _status_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _results_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.ndjson")
+
+    def _save(self, job):
+        path = self._status_path(job['id'])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job, f, indent=4)
+        os.replace(tmp_path, path)
+
+    def create(self, params=None):
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': "queued",
+            'params': params or {},
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'total': None,
+            'processed': 0,
+            'error': None
+        }
+        with self._lock:
+            self._jobs[job['id']] = job
+            self._save(job)
+        return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                # Jobs from an earlier server run are only on disk
+                try:
+                    with open(self._status_path(job_id), "r") as f:
+                        job = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    return None
+                if job['status'] in ("queued", "running"):
+                    job['status'] = "failed"
+                    job['error'] = "Interrupted by a server restart"
+                    self._save(job)
+                self._jobs[job_id] = job
+            return dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            self._save(job)
+
+    def add_result(self, job_id, result):
+        with self._lock:
+            with open(self._results_path(job_id), "a", encoding="utf-8") as f:
+                f.write(json.dumps(result) + "\n")
+            job = self._jobs[job_id]
+            job['processed'] += 1
+            self._save(job)
+
+    def results(self, job_id):
+        try:
+            with open(self._results_path(job_id), "r", encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+
+class JobRunner:
+    """Runs queued jobs one at a time on a background thread.
+
+    handler(params, payload, set_total) must return an iterable of results; each result is stored as it
+    arrives. The payload stays in memory only, so it can hold data that is not JSON-serializable.
+    """
+
+    def __init__(self, store, handler):
+        self.store = store
+        self.handler = handler
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, params=None, payload=None):
+        job = self.store.create(params)
+        self._ensure_started()
+        self._queue.put((job['id'], payload))
+        logger.info(f"Queued job {job['id']}")
+        return job
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="job-runner", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            job_id, payload = self._queue.get()
+            job = self.store.get(job_id)
+            logger.info(f"Starting job {job_id}")
+            self.store.update(job_id, status="running", started_at=datetime.now().isoformat())
+            try:
+                results = self.handler(job['params'], payload, lambda total: self.store.update(job_id, total=total))
+                for result in results:
+                    self.store.add_result(job_id, result)
+                self.store.update(job_id, status="completed", finished_at=datetime.now().isoformat())
+                logger.info(f"Job {job_id} completed")
+            except Exception as e:
+                logger.error(f"Error running job {job_id}: {str(e)}")
+                self.store.update(job_id, status="failed", error=str(e), finished_at=datetime.now().isoformat())
@@ -0,0 +1,55 @@
+import os
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = ".processed_manifest.json"
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST_FILE)
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.error(f"Error reading manifest {path}, treating every file as new: {str(e)}")
+        return {}
+
+
+def save_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def compute_file_hash(filepath):
+    digest = hashlib.md5()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def select_changed_files(filepaths, manifest, force=False):
+    """Returns (changed filepaths, manifest entries for them); unchanged size+mtime skips hashing."""
+    changed, entries = [], {}
+    for filepath in filepaths:
+        stat = os.stat(filepath)
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        previous = manifest.get(filepath)
+        if not force and previous and previous['size'] == entry['size'] and previous['mtime'] == entry['mtime']:
+            continue
+        entry['content_hash'] = compute_file_hash(filepath)
+        if not force and previous and previous.get('content_hash') == entry['content_hash']:
+            # Touched but identical: refresh the stat fields without reprocessing
+            manifest[filepath] = entry
+            continue
+        changed.append(filepath)
+        entries[filepath] = entry
+    return changed, entries
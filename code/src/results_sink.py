@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+
+logger = logging.getLogger(__name__)
+
+RESULTS_FILE = "results.ndjson"
+RESULTS_MAX_BYTES = 50 * 1024 * 1024
+RESULTS_BACKUP_COUNT = 5
+FSYNC_EVERY = 50
+FSYNC_INTERVAL = 2.0
+
+
+class ResultSink:
+    """Append-only newline-delimited JSON result writer.
+
+    Records are flushed to the OS on every write and fsynced every fsync_every records or
+    fsync_interval seconds. When the file passes max_bytes it is rotated to path.1, path.2, ...
+    """
+
+    def __init__(self, path=RESULTS_FILE, max_bytes=RESULTS_MAX_BYTES, backup_count=RESULTS_BACKUP_COUNT,
+                 fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def write(self, result):
+        line = json.dumps(result, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._lock:
+            if self.max_bytes and self._file.tell() + len(line) > self.max_bytes and self._file.tell() > 0:
+                self._rotate()
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            self._sync()
+            self._file.close()
+
+    def _sync(self):
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _rotate(self):
+        self._file.flush()
+        self._sync()
+        self._file.close()
+        rotate_file(self.path, self.backup_count)
+        self._file = open(self.path, "ab")
+
+
+def rotate_file(path, backup_count):
+    """Shifts path.N to path.N+1 (dropping the oldest beyond backup_count) and moves path to path.1."""
+    for i in range(backup_count - 1, 0, -1):
+        source = f"{path}.{i}"
+        if os.path.exists(source):
+            os.replace(source, f"{path}.{i + 1}")
+    if backup_count:
+        os.replace(path, f"{path}.1")
+    else:
+        os.remove(path)
+    logger.info(f"Rotated file: {path}")
+
+
+def result_files(path=RESULTS_FILE):
+    """Existing result files, oldest first."""
+    backups = []
+    i = 1
+    while os.path.exists(f"{path}.{i}"):
+        backups.append(f"{path}.{i}")
+        i += 1
+    files = list(reversed(backups))
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def iter_results(path=RESULTS_FILE):
+    """Yields every stored result, oldest first."""
+    for file_path in result_files(path):
+        with open(file_path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def index_results(path=RESULTS_FILE):
+    """Maps each filename to (file path, byte offset) of its most recent result."""
+    index = {}
+    for file_path in result_files(path):
+        with open(file_path, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    index[json.loads(line).get('filename')] = (file_path, offset)
+                offset += len(line)
+    return index
+
+
+def read_result_at(file_path, offset):
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+
+def find_result(path, filename, index=None):
+    """Returns the most recent result for filename, or None; pass a prebuilt index to seek directly."""
+    location = (index if index is not None else index_results(path)).get(filename)
+    return read_result_at(*location) if location else None
+
+
+def tail_results(path=RESULTS_FILE, lines=10, follow=False, poll_interval=1.0):
+    """Yields the last lines results; with follow, keeps yielding new ones and survives rotation."""
+    recent = []
+    for result in iter_results(path):
+        recent.append(result)
+        recent = recent[-lines:] if lines else []
+    yield from recent
+    if not follow:
+        return
+
+    f = open(path, "rb") if os.path.exists(path) else None
+    if f:
+        f.seek(0, os.SEEK_END)
+    try:
+        while True:
+            line = f.readline() if f else b""
+            if line.endswith(b"\n"):
+                if line.strip():
+                    yield json.loads(line)
+                continue
+            if line and f:
+                # Partial line still being written; re-read it next time
+                f.seek(-len(line), os.SEEK_CUR)
+            time.sleep(poll_interval)
+            # Reopen when the file was rotated away or created
+            try:
+                rotated = f is None or os.stat(path).st_ino != os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                rotated = False
+            if rotated:
+                if f:
+                    # Drain what was written before the rotation
+                    for line in f:
+                        if line.endswith(b"\n") and line.strip():
+                            yield json.loads(line)
+                    f.close()
+                f = open(path, "rb")
+    finally:
+        if f:
+            f.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read the NDJSON results written by the email pipeline.")
+    parser.add_argument("path", nargs="?", default=RESULTS_FILE)
+    parser.add_argument("--tail", type=int, default=10, help="number of most recent results to print")
+    parser.add_argument("--follow", action="store_true", help="keep printing results as they are written")
+    parser.add_argument("--filename", help="print the most recent result for this email file")
+    args = parser.parse_args()
+
+    try:
+        if args.filename:
+            result = find_result(args.path, args.filename)
+            if result is None:
+                sys.exit(f"No result for {args.filename}")
+            print(json.dumps(result, indent=4))
+        else:
+            for result in tail_results(args.path, args.tail, args.follow):
+                print(json.dumps(result))
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
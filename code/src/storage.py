@@ -0,0 +1,602 @@
+import os
+import queue
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Storage backend used by the pipeline: "h2" (jaydebeapi + JVM) or "sqlite" (embedded, WAL mode)
+STORAGE_BACKEND = "h2"
+
+H2_DRIVER = "org.h2.Driver"
+H2_URL = "jdbc:h2:./email_db"
+H2_CREDENTIALS = ["sa", ""]
+H2_JAR = "h2-latest.jar"
+H2_POOL_SIZE = 4
+H2_POOL_TIMEOUT = 30
+
+SQLITE_PATH = "email_db.sqlite"
+SQLITE_POOL_SIZE = 4
+SQLITE_POOL_TIMEOUT = 30
+
+# The pipeline writes rows in chunks of STORE_CHUNK_SIZE, or whatever is buffered after
+# STORE_FLUSH_INTERVAL seconds
+STORE_CHUNK_SIZE = 200
+STORE_FLUSH_INTERVAL = 5.0
+
+# Rows are (filename, request_type, sub_request_type, confidence, context, email_hash, email_from)
+HASH_COLUMN = 5
+FROM_COLUMN = 6
+
+
+def row_key(row):
+    return (row[HASH_COLUMN], row[FROM_COLUMN])
+
+
+class StorageBackend:
+    """Schema setup, duplicate probe, insert, upsert and query for the emails table."""
+
+    def setup_schema(self):
+        raise NotImplementedError
+
+    def find_duplicates(self, keys):
+        """Returns the subset of (email_hash, email_from) keys already stored."""
+        raise NotImplementedError
+
+    def insert(self, rows):
+        raise NotImplementedError
+
+    def upsert(self, rows):
+        """Stores rows atomically and returns, per row, whether it was already stored."""
+        raise NotImplementedError
+
+    def query(self, sql, params=()):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def count_hits(rows):
+        # Repeats of a key within one upsert are merged once with their count,
+        # so only the first occurrence can be new
+        hits = {}
+        unique_rows = []
+        for row in rows:
+            key = row_key(row)
+            if key not in hits:
+                unique_rows.append(row)
+                hits[key] = 0
+            hits[key] += 1
+        return unique_rows, hits
+
+    @staticmethod
+    def mark_duplicates(rows, hits, final_counts):
+        # A key existed before the upsert if its final count exceeds what the upsert added
+        existed = {key: seen_count > hits[key] for key, seen_count in final_counts.items()}
+        is_duplicate = []
+        first_seen = set()
+        for row in rows:
+            key = row_key(row)
+            is_duplicate.append(existed.get(key, False) or key in first_seen)
+            first_seen.add(key)
+        return is_duplicate
+
+
+# Ordered schema migrations; existing email_db files are brought up to date on first connect
+H2_MIGRATIONS = [
+    (1, ["""
+        CREATE TABLE IF NOT EXISTS emails (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            filename VARCHAR(255),
+            request_type VARCHAR(255),
+            sub_request_type VARCHAR(255),
+            confidence FLOAT,
+            context TEXT,
+            email_hash VARCHAR(255),
+            email_from VARCHAR(255)
+        )
+    """]),
+    # Duplicate detection probes (email_hash, email_from); without this it is a full table scan
+    (2, ["CREATE INDEX IF NOT EXISTS idx_emails_hash_from ON emails(email_hash, email_from)"]),
+    # One email_keys row per (email_hash, email_from) so upserts can report duplicates
+    # atomically; emails keeps one row per received email. Backfilled from existing rows.
+    (3, [
+        """
+        CREATE TABLE IF NOT EXISTS email_keys (
+            email_hash VARCHAR(255) NOT NULL,
+            email_from VARCHAR(255) NOT NULL,
+            seen_count INT NOT NULL,
+            PRIMARY KEY (email_hash, email_from)
+        )
+        """,
+        """
+        INSERT INTO email_keys (email_hash, email_from, seen_count)
+        SELECT email_hash, email_from, COUNT(*) FROM emails
+        WHERE email_hash IS NOT NULL AND email_from IS NOT NULL
+        GROUP BY email_hash, email_from
+        """,
+    ]),
+]
+
+
+def setup_h2_database(cursor):
+    logger.info("Setting up H2 database...")
+    cursor.execute("CREATE TABLE IF NOT EXISTS schema_version (version INT PRIMARY KEY)")
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    current = cursor.fetchone()[0] or 0
+    for version, statements in H2_MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying H2 schema migration {version}")
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+    logger.info("H2 database setup complete.")
+
+
+class H2ConnectionPool:
+    """Bounded pool of jaydebeapi connections; the schema is created once, on the first connection."""
+
+    def __init__(self, url=H2_URL, size=H2_POOL_SIZE, timeout=H2_POOL_TIMEOUT):
+        self.url = url
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self):
+        # Imported here so the SQLite backend never needs a JVM
+        import jaydebeapi
+        conn = jaydebeapi.connect(H2_DRIVER, self.url, H2_CREDENTIALS, H2_JAR)
+        # jaydebeapi leaves JDBC autocommit on, which would commit each statement of an
+        # upsert on its own and make rollback() a no-op
+        conn.jconn.setAutoCommit(False)
+        with self._lock:
+            if not self._schema_ready:
+                cursor = conn.cursor()
+                setup_h2_database(cursor)
+                cursor.close()
+                conn.commit()
+                self._schema_ready = True
+        return conn
+
+    def _is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding unhealthy H2 connection: {str(e)}")
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            conn = self._idle.get(timeout=self.timeout)
+
+        if self._is_healthy(conn):
+            return conn
+        self._discard(conn)
+        return self.acquire()
+
+    def release(self, conn):
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+class H2Storage(StorageBackend):
+    def __init__(self, url=H2_URL):
+        self.pool = H2ConnectionPool(url)
+
+    def setup_schema(self):
+        # The pool runs the migrations on its first connection
+        with self.pool.connection():
+            pass
+
+    def find_duplicates(self, keys):
+        logger.info(f"Detecting duplicates for {len(keys)} emails")
+        if not keys:
+            return set()
+        existing = set()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            # One primary-key probe per key on email_keys, instead of every emails row per hash
+            for key in set(keys):
+                cursor.execute("SELECT 1 FROM email_keys WHERE email_hash = ? AND email_from = ? LIMIT 1", key)
+                if cursor.fetchone() is not None:
+                    existing.add(key)
+            cursor.close()
+        logger.info(f"Duplicate check: {len(existing)} already stored")
+        return existing
+
+    def insert(self, rows):
+        logger.info(f"Storing {len(rows)} emails")
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO emails (filename, request_type, sub_request_type, confidence, context, email_hash, email_from)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            cursor.close()
+        logger.info("Email data stored successfully.")
+
+    def upsert(self, rows):
+        # One MERGE counts every key in email_keys and returns the final counts; every row is
+        # then inserted into emails in the same transaction
+        logger.info(f"Upserting {len(rows)} emails")
+        unique_rows, hits = self.count_hits(rows)
+        values = ", ".join("(CAST(? AS VARCHAR(255)), CAST(? AS VARCHAR(255)), CAST(? AS INT))" for _ in unique_rows)
+        params = [value for row in unique_rows for value in (*row_key(row), hits[row_key(row)])]
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT email_hash, email_from, seen_count FROM FINAL TABLE (
+                    MERGE INTO email_keys t
+                    USING (VALUES {values}) AS s(email_hash, email_from, hits)
+                    ON t.email_hash = s.email_hash AND t.email_from = s.email_from
+                    WHEN MATCHED THEN UPDATE SET seen_count = t.seen_count + s.hits
+                    WHEN NOT MATCHED THEN INSERT (email_hash, email_from, seen_count) VALUES (s.email_hash, s.email_from, s.hits)
+                )
+            """, tuple(params))
+            final_counts = {(email_hash, email_from): seen_count for email_hash, email_from, seen_count in cursor.fetchall()}
+            cursor.executemany("""
+                INSERT INTO emails (filename, request_type, sub_request_type, confidence, context, email_hash, email_from)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            cursor.close()
+        return self.mark_duplicates(rows, hits, final_counts)
+
+    def query(self, sql, params=()):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, tuple(params))
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+
+    def close(self):
+        self.pool.close_all()
+
+
+# SQLite schema versions are tracked with PRAGMA user_version
+SQLITE_MIGRATIONS = [
+    (1, ["""
+        CREATE TABLE IF NOT EXISTS emails (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT,
+            request_type TEXT,
+            sub_request_type TEXT,
+            confidence REAL,
+            context TEXT,
+            email_hash TEXT,
+            email_from TEXT
+        )
+    """, """
+        CREATE INDEX IF NOT EXISTS idx_emails_hash_from ON emails(email_hash, email_from)
+    """, """
+        CREATE TABLE IF NOT EXISTS email_keys (
+            email_hash TEXT NOT NULL,
+            email_from TEXT NOT NULL,
+            seen_count INTEGER NOT NULL,
+            PRIMARY KEY (email_hash, email_from)
+        )
+    """]),
+]
+
+# Stay under SQLite's bound-parameter limit on older builds (999)
+SQLITE_ROWS_PER_STATEMENT = 100
+# The upsert reads back each key's count with INSERT ... ON CONFLICT ... RETURNING
+SQLITE_MIN_VERSION = (3, 35, 0)
+
+
+class SQLiteStorage(StorageBackend):
+    """Embedded SQLite in WAL mode, no JVM.
+
+    Connections come from a bounded pool shared by all threads, so short-lived request
+    threads reuse them instead of each leaving one open.
+    """
+
+    def __init__(self, path=SQLITE_PATH, pool_size=SQLITE_POOL_SIZE, timeout=SQLITE_POOL_TIMEOUT):
+        self.path = path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self):
+        if sqlite3.sqlite_version_info < SQLITE_MIN_VERSION:
+            raise RuntimeError(f"The sqlite storage backend needs SQLite {'.'.join(map(str, SQLITE_MIN_VERSION))} or newer "
+                               f"(for RETURNING); this Python is linked against SQLite {sqlite3.sqlite_version}")
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            if not self._schema_ready:
+                self._migrate(conn)
+                self._schema_ready = True
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.pool_size
+            if can_create:
+                self._created += 1
+        if not can_create:
+            return self._idle.get(timeout=self.timeout)
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextmanager
+    def _connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def _migrate(self, conn):
+        logger.info("Setting up SQLite database...")
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, statements in SQLITE_MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info(f"Applying SQLite schema migration {version}")
+            with conn:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
+        logger.info("SQLite database setup complete.")
+
+    def setup_schema(self):
+        # The first connection runs the migrations
+        with self._connection():
+            pass
+
+    def find_duplicates(self, keys):
+        logger.info(f"Detecting duplicates for {len(keys)} emails")
+        if not keys:
+            return set()
+        existing = set()
+        with self._connection() as conn:
+            # One primary-key probe per key on email_keys, instead of every emails row per hash
+            for key in set(keys):
+                if conn.execute("SELECT 1 FROM email_keys WHERE email_hash = ? AND email_from = ? LIMIT 1", key).fetchone():
+                    existing.add(key)
+        logger.info(f"Duplicate check: {len(existing)} already stored")
+        return existing
+
+    def insert(self, rows):
+        logger.info(f"Storing {len(rows)} emails")
+        with self._connection() as conn, conn:
+            conn.executemany("""
+                INSERT INTO emails (filename, request_type, sub_request_type, confidence, context, email_hash, email_from)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        logger.info("Email data stored successfully.")
+
+    def upsert(self, rows):
+        logger.info(f"Upserting {len(rows)} emails")
+        unique_rows, hits = self.count_hits(rows)
+        final_counts = {}
+        with self._connection() as conn, conn:
+            for start in range(0, len(unique_rows), SQLITE_ROWS_PER_STATEMENT):
+                chunk = unique_rows[start:start + SQLITE_ROWS_PER_STATEMENT]
+                values = ", ".join("(?, ?, ?)" for _ in chunk)
+                params = [value for row in chunk for value in (*row_key(row), hits[row_key(row)])]
+                cursor = conn.execute(f"""
+                    INSERT INTO email_keys (email_hash, email_from, seen_count)
+                    VALUES {values}
+                    ON CONFLICT (email_hash, email_from) DO UPDATE SET seen_count = seen_count + excluded.seen_count
+                    RETURNING email_hash, email_from, seen_count
+                """, params)
+                final_counts.update({(email_hash, email_from): seen_count for email_hash, email_from, seen_count in cursor.fetchall()})
+            conn.executemany("""
+                INSERT INTO emails (filename, request_type, sub_request_type, confidence, context, email_hash, email_from)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        return self.mark_duplicates(rows, hits, final_counts)
+
+    def query(self, sql, params=()):
+        with self._connection() as conn:
+            return conn.execute(sql, tuple(params)).fetchall()
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._lock:
+                self._created -= 1
+
+
+class EmailBatchWriter:
+    """Buffers rows and upserts them in chunks; add, flush and close return the results that are done."""
+
+    def __init__(self, storage, chunk_size=STORE_CHUNK_SIZE, flush_interval=STORE_FLUSH_INTERVAL):
+        self.storage = storage
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.seconds = 0.0
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._retry_at = 0.0
+
+    def add(self, row, result):
+        self._pending.append((row, result))
+        now = time.monotonic()
+        if now < self._retry_at:
+            return []
+        if len(self._pending) >= self.chunk_size or now - self._last_flush >= self.flush_interval:
+            return self.flush()
+        return []
+
+    def seconds_until_flush(self):
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        return max(0.0, self.flush_interval - (now - self._last_flush), self._retry_at - now)
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return []
+        pending, self._pending = self._pending, []
+        started = time.perf_counter()
+        # A concurrent writer can insert the same new email_keys row between our upsert's
+        # match check and its insert; the retry then sees that key as matched.
+        if self._upsert(pending) or self._upsert(pending):
+            stored, bad, kept = pending, [], []
+        else:
+            stored, bad, kept = self._store_in_halves(pending)
+        if kept:
+            # Keep the rows for the next flush instead of reporting them as stored
+            self._pending = kept + self._pending
+            self._retry_at = time.monotonic() + self.flush_interval
+        if bad:
+            logger.error(f"Giving up on storing {len(bad)} emails that failed on their own")
+            for _, result in bad:
+                result['stored'] = False
+                result['is_duplicate'] = None
+        if stored:
+            elapsed = time.perf_counter() - started
+            self.rows_written += len(stored)
+            self.seconds += elapsed
+            logger.info(f"Stored {len(stored)} emails in {elapsed:.3f}s ({len(stored) / elapsed if elapsed else 0:.1f} rows/s)")
+        done = {id(result) for _, result in stored + bad}
+        return [result for _, result in pending if id(result) in done]
+
+    def _upsert(self, pending):
+        rows = [row for row, _ in pending]
+        try:
+            is_duplicate = self.storage.upsert(rows)
+        except Exception as e:
+            logger.error(f"Error storing {len(rows)} emails: {str(e)}")
+            return False
+        for (_, result), duplicate in zip(pending, is_duplicate):
+            result['is_duplicate'] = duplicate
+            result['stored'] = True
+        return True
+
+    def _store_in_halves(self, pending):
+        # Splits a failing chunk until its failing rows are isolated, so one bad row (e.g. a
+        # value too long for its column) does not hold back the rest. Returns (stored, bad,
+        # kept): if a single row fails before anything was stored, the database itself is
+        # failing and every row not yet stored is kept for a later flush.
+        stored, bad = [], []
+        groups = [pending]
+        while groups:
+            group = groups.pop()
+            if group is not pending and self._upsert(group):
+                stored += group
+            elif len(group) > 1:
+                groups += [group[len(group) // 2:], group[:len(group) // 2]]
+            elif stored:
+                bad += group
+            else:
+                return [], [], group + [pair for group in reversed(groups) for pair in group]
+        return stored, bad, []
+
+    def close(self):
+        results = self.flush()
+        if self._pending:
+            logger.error(f"Giving up on storing {len(self._pending)} emails")
+            for _, result in self._pending:
+                result['stored'] = False
+                result['is_duplicate'] = None
+            results += [result for _, result in self._pending]
+            self._pending = []
+        if self.rows_written:
+            logger.info(f"Email writer total: {self.rows_written} rows in {self.seconds:.3f}s "
+                        f"({self.rows_written / self.seconds if self.seconds else 0:.1f} rows/s)")
+        return results
+
+
+def create_storage(backend=None, **kwargs):
+    backend = backend or STORAGE_BACKEND
+    if backend == "h2":
+        return H2Storage(**kwargs)
+    if backend == "sqlite":
+        return SQLiteStorage(**kwargs)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+STORAGE = None
+STORAGE_PID = None
+STORAGE_LOCK = threading.Lock()
+
+
+def get_storage():
+    # Connections do not survive a fork, so each worker process builds its own backend
+    global STORAGE, STORAGE_PID
+    with STORAGE_LOCK:
+        if STORAGE is None or STORAGE_PID != os.getpid():
+            STORAGE = create_storage()
+            STORAGE_PID = os.getpid()
+        return STORAGE
@@ -1,11 +1,9 @@
 import os
 import logging
-import pdfplumber
-import pypandoc
 from email import policy
 from email.parser import BytesParser
-from docx import Document
 from bs4 import BeautifulSoup  # To extract text from HTML emails
+from attachment_extraction import process_attachment
 
 # Configure Logging
 logging.basicConfig(filename="email_processing.log", level=logging.INFO,
@@ -13,10 +11,6 @@ logging.basicConfig(filename="email_processing.log", level=logging.INFO,
 
 # Directories
 EMAIL_DIR = "test/"
-ATTACHMENTS_DIR = "attachments/"
-
-# Ensure the attachments directory exists
-os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
 
 
 def read_eml_file(file_path):
@@ -77,79 +71,13 @@ def extract_attachments(msg):
             if not filename:
                 filename = f"attachment_{len(extracted_data) + 1}"
 
-            file_path = os.path.join(ATTACHMENTS_DIR, filename)
-
-            # Save the attachment
-            with open(file_path, "wb") as f:
-                f.write(part.get_payload(decode=True))
-
-            # Extract text from the attachment
-            text = process_attachment(file_path)
+            # Extract text from the decoded payload in memory
+            text = process_attachment(filename, part.get_payload(decode=True))
             extracted_data[filename] = text
 
     return extracted_data
 
 
-def process_attachment(file_path):
-    """Reads and extracts text from PDF, DOCX, DOC, TXT files."""
-    try:
-        if file_path.endswith(".pdf"):
-            return extract_text_from_pdf(file_path)
-        elif file_path.endswith(".docx"):
-            return extract_text_from_docx(file_path)
-        elif file_path.endswith(".doc"):
-            return extract_text_from_doc(file_path)
-        elif file_path.endswith(".txt"):
-            return extract_text_from_txt(file_path)
-        else:
-            logging.warning(f"Unsupported file type: {file_path}")
-            return "(Unsupported file type)"
-    except Exception as e:
-        logging.error(f"Error processing attachment {file_path}: {e}")
-        return "(Error processing attachment)"
-
-
-def extract_text_from_pdf(pdf_path):
-    """Extracts text from a PDF file."""
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = "\n".join([page.extract_text() for page in pdf.pages if page.extract_text()])
-        return text if text else "(No readable text in PDF)"
-    except Exception as e:
-        logging.error(f"Error reading PDF {pdf_path}: {e}")
-        return "(Error reading PDF)"
-
-
-def extract_text_from_docx(docx_path):
-    """Extracts text from a DOCX file."""
-    try:
-        doc = Document(docx_path)
-        text = "\n".join([para.text for para in doc.paragraphs])
-        return text if text else "(No readable text in DOCX)"
-    except Exception as e:
-        logging.error(f"Error reading DOCX {docx_path}: {e}")
-        return "(Error reading DOCX)"
-
-
-def extract_text_from_doc(doc_path):
-    """Extracts text from a DOC file using pypandoc."""
-    try:
-        return pypandoc.convert_file(doc_path, "plain")
-    except Exception as e:
-        logging.error(f"Error reading DOC {doc_path}: {e}")
-        return "(Error reading DOC)"
-
-
-def extract_text_from_txt(txt_path):
-    """Extracts text from a TXT file."""
-    try:
-        with open(txt_path, "r", encoding="utf-8") as f:
-            return f.read().strip()
-    except Exception as e:
-        logging.error(f"Error reading TXT {txt_path}: {e}")
-        return "(Error reading TXT)"
-
-
 def process_all_emails(directory):
     """Processes all .eml files in the specified directory."""
     for filename in os.listdir(directory):
@@ -0,0 +1,11 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Worker processes are started by a fork server (spawn where there is none) instead of being
+# forked from the pipeline: a fork copies locks held by the pipeline's other threads (logging,
+# stdio) into the child, which can then hang on its first write
+WORKER_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def create_process_pool(max_workers=None):
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(WORKER_START_METHOD))
@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import signal
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import attachment_extraction
+from attachment_extraction import join_within_budget, process_attachment, iter_with_attachment_text
+
+
+class JoinWithinBudgetTest(unittest.TestCase):
+    def test_stops_consuming_once_budget_is_reached(self):
+        consumed = []
+
+        def pages():
+            for text in ["a" * 10, "b" * 10, "c" * 10]:
+                consumed.append(text)
+                yield text
+
+        self.assertEqual(join_within_budget(pages(), 15), "a" * 10 + "\n" + "b" * 10)
+        self.assertEqual(len(consumed), 2)
+
+    def test_without_budget_joins_everything(self):
+        self.assertEqual(join_within_budget(["a", "b", "c"]), "a\nb\nc")
+
+
+class ProcessAttachmentTest(unittest.TestCase):
+    def test_txt_is_read_from_memory(self):
+        self.assertEqual(process_attachment("notes.txt", b"  Loan notice  \n"), "Loan notice")
+
+    def test_unsupported_type(self):
+        self.assertEqual(process_attachment("sheet.xls", b""), "(Unsupported file type)")
+
+    def test_empty_text(self):
+        self.assertEqual(process_attachment("empty.txt", b""), "(No readable text in TXT)")
+
+
+class TextAttachment:
+    name = "notes.txt"
+    size = 11
+
+    def read(self):
+        return b"Loan notice"
+
+
+class StuckAttachment:
+    """Blocks SIGALRM and never returns, like an extractor stuck in C code."""
+    name = "stuck.txt"
+    size = 11
+
+    def read(self):
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+        time.sleep(600)
+
+
+class AttachmentWorkersTest(unittest.TestCase):
+    def setUp(self):
+        for name, value in [("ATTACHMENT_WORKERS", 1), ("ATTACHMENT_HARD_TIMEOUT", 1.0)]:
+            patcher = mock.patch.object(attachment_extraction, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.discard_pool)
+
+    def discard_pool(self):
+        if attachment_extraction.ATTACHMENT_EXECUTOR is not None:
+            attachment_extraction.discard_attachment_executor(attachment_extraction.ATTACHMENT_EXECUTOR)
+
+    def run_with_deadline(self, emails, seconds):
+        results = []
+        thread = threading.Thread(target=lambda: results.extend(iter_with_attachment_text(emails)), daemon=True)
+        thread.start()
+        thread.join(seconds)
+        self.assertFalse(thread.is_alive(), "attachment stage hung")
+        return results
+
+    def test_text_is_added_to_the_email(self):
+        results = self.run_with_deadline([("a.eml", {'attachments': [TextAttachment()]})], 30)
+        self.assertEqual(results, [("a.eml", {'attachments': results[0][1]['attachments'], 'attachment_text': "Loan notice"})])
+
+    def test_stuck_workers_are_replaced_while_waiting_for_a_slot(self):
+        emails = [(f"{n}.eml", {'attachments': [StuckAttachment()]}) for n in range(3)]
+        emails.append(("text.eml", {'attachments': [TextAttachment()]}))
+        results = self.run_with_deadline(emails, 30)
+        self.assertEqual([source for source, _ in results], ["0.eml", "1.eml", "2.eml", "text.eml"])
+        self.assertFalse(any('attachment_text' in email_data for _, email_data in results[:3]))
+        self.assertEqual(results[3][1].get('attachment_text'), "Loan notice")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from audit_log import AuditLogWriter
+
+
+class AuditLogWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "audit.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_flush_writes_every_logged_record(self):
+        writer = AuditLogWriter(self.path, flush_interval=60)
+        for n in range(3):
+            writer.log({'n': n})
+        writer.flush()
+        self.assertEqual(self.read(self.path), [{'n': 0}, {'n': 1}, {'n': 2}])
+        writer.close()
+
+    def test_close_writes_pending_records(self):
+        writer = AuditLogWriter(self.path, flush_interval=60)
+        writer.log({'n': 0})
+        writer.close()
+        self.assertEqual(self.read(self.path), [{'n': 0}])
+
+    def test_rotation_keeps_backup_count_files(self):
+        writer = AuditLogWriter(self.path, max_bytes=40, backup_count=2)
+        for n in range(10):
+            writer.log({'filename': f"email{n}.eml"})
+        writer.close()
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["audit.jsonl", "audit.jsonl.1", "audit.jsonl.2"])
+        self.assertEqual(self.read(self.path), [{'filename': "email9.eml"}])
+        self.assertEqual(self.read(self.path + ".1"), [{'filename': "email8.eml"}])
+
+    def test_values_json_cannot_encode_are_written_as_strings(self):
+        writer = AuditLogWriter(self.path)
+        writer.log({'timestamp': datetime(2024, 1, 2, 3, 4, 5)})
+        writer.close()
+        self.assertEqual(self.read(self.path), [{'timestamp': "2024-01-02 03:04:05"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
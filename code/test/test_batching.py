@@ -0,0 +1,35 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from batching import token_budget_batches
+
+
+class TokenBudgetBatchesTest(unittest.TestCase):
+    def test_every_index_is_batched_once(self):
+        lengths = [30, 5, 200, 12, 12, 90, 1]
+        batches = token_budget_batches(lengths, 3, 100)
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(len(lengths))))
+
+    def test_padded_size_stays_within_budget(self):
+        lengths = [10, 50, 20, 40, 30, 10]
+        for batch in token_budget_batches(lengths, 32, 100):
+            self.assertLessEqual(len(batch) * max(lengths[i] for i in batch), 100)
+
+    def test_shortest_items_are_batched_together(self):
+        self.assertEqual(token_budget_batches([50, 10, 40, 10], 32, 100), [[1, 3], [2, 0]])
+
+    def test_batch_size_cap(self):
+        self.assertEqual(token_budget_batches([1] * 5, 2, 1000), [[0, 1], [2, 3], [4]])
+
+    def test_item_over_budget_gets_its_own_batch(self):
+        self.assertEqual(token_budget_batches([500, 10], 32, 100), [[1], [0]])
+
+    def test_no_items(self):
+        self.assertEqual(token_budget_batches([], 32, 100), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import pickle
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from email_parsing import extract_email_components_from_bytes
+
+PLAIN = b"From: customer@example.com\nSubject: Fee\nContent-Type: text/plain%s\n\n%s\n"
+
+MULTIPART = b"""From: customer@example.com
+Subject: Notice
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="X"
+
+--X
+Content-Type: text/plain
+
+See attached.
+--X
+Content-Type: application/pdf
+Content-Disposition: attachment; filename="notice.pdf"
+Content-Transfer-Encoding: base64
+
+JVBERi0xLjQK
+--X--
+"""
+
+
+class DecodeTextPartTest(unittest.TestCase):
+    def parse(self, content_type, body):
+        return extract_email_components_from_bytes(PLAIN % (content_type, body), "email.eml")
+
+    def test_declared_charset_is_used(self):
+        email_data = self.parse(b"; charset=iso-8859-1", b"Caf\xe9")
+        self.assertEqual(email_data['body'], "Café\n")
+        self.assertEqual(email_data['decode_stats'], {'parts': 1, 'fallback': 0, 'replaced': 0})
+
+    def test_undeclared_latin1_counts_as_fallback(self):
+        email_data = self.parse(b"", b"Caf\xe9")
+        self.assertEqual(email_data['body'], "Café\n")
+        self.assertEqual(email_data['decode_stats']['fallback'], 1)
+
+    def test_unknown_charset_falls_back(self):
+        email_data = self.parse(b"; charset=bogus", b"Caf\xc3\xa9")
+        self.assertEqual(email_data['body'], "Café\n")
+        self.assertEqual(email_data['decode_stats']['fallback'], 1)
+
+    def test_crlf_is_normalised(self):
+        email_data = extract_email_components_from_bytes(b"Subject: s\r\n\r\none\r\ntwo\r\n", "email.eml")
+        self.assertEqual(email_data['body'], "one\ntwo\n")
+
+
+class LazyAttachmentTest(unittest.TestCase):
+    def test_payload_is_decoded_on_read(self):
+        attachment = extract_email_components_from_bytes(MULTIPART, "email.eml")['attachments'][0]
+        self.assertEqual((attachment.name, attachment.content_type), ("notice.pdf", "application/pdf"))
+        self.assertEqual(attachment.read(), b"%PDF-1.4\n")
+
+    def test_pickled_handle_carries_only_its_part(self):
+        attachment = extract_email_components_from_bytes(MULTIPART, "email.eml")['attachments'][0]
+        restored = pickle.loads(pickle.dumps(attachment))
+        self.assertEqual(restored.read(), b"%PDF-1.4\n")
+        self.assertEqual(restored.source, b"%PDF-1.4\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
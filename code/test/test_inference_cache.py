@@ -0,0 +1,50 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from itertools import count
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inference_cache import InferenceCache
+
+
+class InferenceCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = InferenceCache(os.path.join(self.tmp_dir, "cache.db"), max_entries=2)
+        # A strictly increasing clock, so last_access never ties
+        clock = count(1)
+        patcher = mock.patch("inference_cache.time.time", side_effect=lambda: next(clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_values_round_trip(self):
+        self.cache.put_many("v1", {"a": {'intent': "Loan Request"}})
+        self.assertEqual(self.cache.get_many("v1", ["a", "b"]), {"a": {'intent': "Loan Request"}})
+        self.assertEqual(self.cache.get_many("v1", []), {})
+
+    def test_versions_are_isolated(self):
+        self.cache.put_many("v1", {"a": 1})
+        self.assertEqual(self.cache.get_many("v2", ["a"]), {})
+        self.cache.put_many("v2", {"a": 2})
+        self.assertEqual(self.cache.get_many("v1", ["a"]), {"a": 1})
+        self.assertEqual(self.cache.get_many("v2", ["a"]), {"a": 2})
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.put_many("v1", {"a": 1})
+        self.cache.put_many("v1", {"b": 2})
+        # Reading "a" makes "b" the least recently used
+        self.cache.get_many("v1", ["a"])
+        self.cache.put_many("v1", {"c": 3})
+        self.assertEqual(self.cache.get_many("v1", ["a", "b", "c"]), {"a": 1, "c": 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
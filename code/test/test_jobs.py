@@ -0,0 +1,80 @@
+import os
+import sys
+import shutil
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from jobs import JobStore, JobRunner
+
+
+class JobStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = JobStore(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_results_and_progress_are_recorded(self):
+        job = self.store.create({'files': ["a.eml"]})
+        self.store.add_result(job['id'], {'filename': "a.eml"})
+        self.assertEqual(self.store.get(job['id'])['processed'], 1)
+        self.assertEqual(self.store.results(job['id']), [{'filename': "a.eml"}])
+        self.assertEqual(self.store.results("missing"), [])
+
+    def test_restart_marks_unfinished_jobs_interrupted(self):
+        queued = self.store.create()
+        running = self.store.create()
+        completed = self.store.create()
+        self.store.update(running['id'], status="running")
+        self.store.update(completed['id'], status="completed")
+
+        restarted = JobStore(self.tmp_dir)
+        for job in (queued, running):
+            status = restarted.get(job['id'])
+            self.assertEqual(status['status'], "failed")
+            self.assertEqual(status['error'], "Interrupted by a server restart")
+        self.assertEqual(restarted.get(completed['id'])['status'], "completed")
+        self.assertIsNone(restarted.get("missing"))
+
+
+class JobRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = JobStore(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def wait_for(self, job_id):
+        for _ in range(100):
+            job = self.store.get(job_id)
+            if job['status'] in ("completed", "failed"):
+                return job
+            time.sleep(0.05)
+        self.fail(f"Job {job_id} did not finish")
+
+    def test_results_are_stored_as_they_arrive(self):
+        def handler(params, payload, set_total):
+            set_total(len(payload))
+            return ({'n': n} for n in payload)
+
+        job = JobRunner(self.store, handler).submit({'files': []}, [1, 2])
+        status = self.wait_for(job['id'])
+        self.assertEqual((status['status'], status['total'], status['processed']), ("completed", 2, 2))
+        self.assertEqual(self.store.results(job['id']), [{'n': 1}, {'n': 2}])
+
+    def test_handler_error_fails_the_job(self):
+        def handler(params, payload, set_total):
+            raise ValueError("bad upload")
+
+        job = JobRunner(self.store, handler).submit()
+        status = self.wait_for(job['id'])
+        self.assertEqual((status['status'], status['error']), ("failed", "bad upload"))
+
+
+if __name__ == "__main__":
+    unittest.main()
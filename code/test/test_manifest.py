@@ -0,0 +1,71 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from manifest import load_manifest, save_manifest, select_changed_files, MANIFEST_FILE
+
+
+class SelectChangedFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content, mtime=None):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "w") as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def record(self, manifest, filepaths):
+        changed, entries = select_changed_files(filepaths, manifest)
+        manifest.update(entries)
+        return changed
+
+    def test_new_files_are_selected_once(self):
+        paths = [self.write("a.eml", "a"), self.write("b.eml", "b")]
+        manifest = {}
+        self.assertEqual(self.record(manifest, paths), paths)
+        self.assertEqual(self.record(manifest, paths), [])
+
+    def test_changed_content_is_selected(self):
+        path = self.write("a.eml", "a", mtime=1000)
+        manifest = {}
+        self.record(manifest, [path])
+        self.write("a.eml", "changed", mtime=2000)
+        self.assertEqual(self.record(manifest, [path]), [path])
+
+    def test_touched_but_identical_file_is_skipped(self):
+        path = self.write("a.eml", "a", mtime=1000)
+        manifest = {}
+        self.record(manifest, [path])
+        os.utime(path, (2000, 2000))
+        self.assertEqual(self.record(manifest, [path]), [])
+        self.assertEqual(manifest[path]['mtime'], 2000)
+
+    def test_force_selects_everything(self):
+        path = self.write("a.eml", "a")
+        manifest = {}
+        self.record(manifest, [path])
+        changed, _ = select_changed_files([path], manifest, force=True)
+        self.assertEqual(changed, [path])
+
+    def test_manifest_round_trip(self):
+        self.assertEqual(load_manifest(self.tmp_dir), {})
+        save_manifest(self.tmp_dir, {'a.eml': {'size': 1}})
+        self.assertEqual(load_manifest(self.tmp_dir), {'a.eml': {'size': 1}})
+
+    def test_corrupt_manifest_treats_every_file_as_new(self):
+        self.write(MANIFEST_FILE, "{not json")
+        self.assertEqual(load_manifest(self.tmp_dir), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from results_sink import ResultSink, result_files, iter_results, find_result, tail_results
+
+
+class ResultSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "results.ndjson")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, count, **kwargs):
+        sink = ResultSink(self.path, **kwargs)
+        for i in range(count):
+            sink.write({'filename': f"email{i}.eml", 'n': i})
+        sink.close()
+
+    def test_results_are_read_back_in_order(self):
+        self.write(3)
+        self.assertEqual([r['n'] for r in iter_results(self.path)], [0, 1, 2])
+
+    def test_rotation_keeps_backups_oldest_first(self):
+        self.write(10, max_bytes=100, backup_count=2)
+        files = result_files(self.path)
+        self.assertEqual(files, [f"{self.path}.2", f"{self.path}.1", self.path])
+        numbers = [r['n'] for r in iter_results(self.path)]
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual(numbers[-1], 9)
+        self.assertLess(len(numbers), 10)
+
+    def test_find_result_returns_most_recent(self):
+        sink = ResultSink(self.path)
+        sink.write({'filename': "a.eml", 'n': 1})
+        sink.write({'filename': "b.eml", 'n': 2})
+        sink.write({'filename': "a.eml", 'n': 3})
+        sink.close()
+        self.assertEqual(find_result(self.path, "a.eml")['n'], 3)
+        self.assertIsNone(find_result(self.path, "missing.eml"))
+
+    def test_tail_results(self):
+        self.write(5)
+        self.assertEqual([r['n'] for r in tail_results(self.path, lines=2)], [3, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import importlib.util
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import storage
+from storage import StorageBackend, SQLiteStorage, H2Storage, EmailBatchWriter, row_key
+
+H2_JAR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", storage.H2_JAR)
+H2_AVAILABLE = importlib.util.find_spec("jaydebeapi") is not None and bool(os.environ.get("JAVA_HOME") or shutil.which("java"))
+
+
+def make_row(email_hash, filename="email.eml", email_from="customer@example.com"):
+    return (filename, "Loan Request", None, 0.9, "{}", email_hash, email_from)
+
+
+class CountHitsTest(unittest.TestCase):
+    def test_repeats_are_counted_once_per_key(self):
+        rows = [make_row("a"), make_row("b"), make_row("a", "resend.eml")]
+        unique_rows, hits = StorageBackend.count_hits(rows)
+        self.assertEqual(unique_rows, [rows[0], rows[1]])
+        self.assertEqual(hits, {row_key(rows[0]): 2, row_key(rows[1]): 1})
+
+    def test_sender_is_part_of_the_key(self):
+        rows = [make_row("a"), make_row("a", email_from="other@example.com")]
+        unique_rows, hits = StorageBackend.count_hits(rows)
+        self.assertEqual(len(unique_rows), 2)
+        self.assertEqual(set(hits.values()), {1})
+
+
+class MarkDuplicatesTest(unittest.TestCase):
+    def test_new_key_only_first_occurrence_is_new(self):
+        rows = [make_row("a"), make_row("a"), make_row("a")]
+        _, hits = StorageBackend.count_hits(rows)
+        final_counts = {row_key(rows[0]): 3}
+        self.assertEqual(StorageBackend.mark_duplicates(rows, hits, final_counts), [False, True, True])
+
+    def test_key_stored_before_is_duplicate(self):
+        rows = [make_row("a"), make_row("b")]
+        _, hits = StorageBackend.count_hits(rows)
+        final_counts = {row_key(rows[0]): 4, row_key(rows[1]): 1}
+        self.assertEqual(StorageBackend.mark_duplicates(rows, hits, final_counts), [True, False])
+
+
+class SQLiteStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.storage = SQLiteStorage(os.path.join(self.tmp_dir, "emails.sqlite"))
+
+    def tearDown(self):
+        self.storage.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_upsert_reports_duplicates_within_and_across_calls(self):
+        self.assertEqual(self.storage.upsert([make_row("a"), make_row("b"), make_row("a")]), [False, False, True])
+        self.assertEqual(self.storage.upsert([make_row("b"), make_row("c")]), [True, False])
+
+    def test_upsert_keeps_a_row_per_received_email(self):
+        self.storage.upsert([make_row("a", "first.eml")])
+        self.storage.upsert([make_row("a", "resend.eml")])
+        self.assertEqual(self.storage.query("SELECT filename FROM emails ORDER BY id"), [("first.eml",), ("resend.eml",)])
+        self.assertEqual(self.storage.query("SELECT seen_count FROM email_keys"), [(2,)])
+
+    def test_find_duplicates_matches_hash_and_sender(self):
+        self.storage.upsert([make_row("a"), make_row("b", email_from="other@example.com")])
+        keys = [("a", "customer@example.com"), ("b", "customer@example.com"), ("b", "other@example.com"), ("c", "customer@example.com")]
+        self.assertEqual(self.storage.find_duplicates(keys), {keys[0], keys[2]})
+        self.assertEqual(self.storage.find_duplicates([]), set())
+
+    def test_threads_share_the_connection_pool(self):
+        threads = [threading.Thread(target=self.storage.upsert, args=([make_row("a")],)) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        self.assertLessEqual(self.storage._created, self.storage.pool_size)
+        self.assertEqual(self.storage.query("SELECT seen_count FROM email_keys"), [(20,)])
+
+    def test_close_releases_idle_connections(self):
+        self.storage.upsert([make_row("a")])
+        self.storage.close()
+        self.assertEqual(self.storage._created, 0)
+
+    def test_old_sqlite_is_rejected(self):
+        with mock.patch.object(storage.sqlite3, "sqlite_version_info", (3, 31, 1)):
+            with self.assertRaisesRegex(RuntimeError, "3.35.0 or newer"):
+                self.storage.upsert([make_row("a")])
+        self.assertEqual(self.storage._created, 0)
+
+
+class GetStorageTest(unittest.TestCase):
+    def test_threads_share_one_backend(self):
+        created = []
+
+        def create_storage():
+            time.sleep(0.01)
+            created.append(object())
+            return created[-1]
+
+        backends = []
+        with mock.patch.object(storage, "STORAGE", None), mock.patch.object(storage, "create_storage", create_storage):
+            threads = [threading.Thread(target=lambda: backends.append(storage.get_storage())) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len(backends), 20)
+
+
+@unittest.skipUnless(H2_AVAILABLE, "needs jaydebeapi and a JVM")
+class H2StorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(storage, "H2_JAR", H2_JAR)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage = H2Storage(f"jdbc:h2:{self.tmp_dir}/email_db")
+
+    def tearDown(self):
+        self.storage.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_upsert_reports_duplicates_within_and_across_calls(self):
+        self.assertEqual(self.storage.upsert([make_row("a"), make_row("b"), make_row("a")]), [False, False, True])
+        self.assertEqual(self.storage.upsert([make_row("b"), make_row("c")]), [True, False])
+        self.assertEqual(self.storage.query("SELECT COUNT(*) FROM emails"), [(5,)])
+
+    def test_find_duplicates_matches_hash_and_sender(self):
+        self.storage.upsert([make_row("a"), make_row("b", email_from="other@example.com")])
+        keys = [("a", "customer@example.com"), ("b", "customer@example.com"), ("b", "other@example.com"), ("c", "customer@example.com")]
+        self.assertEqual(self.storage.find_duplicates(keys), {keys[0], keys[2]})
+        self.assertEqual(self.storage.find_duplicates([]), set())
+
+    def test_failed_insert_rolls_back_the_key_count(self):
+        # filename is VARCHAR(255), so the emails insert fails after the email_keys MERGE
+        with self.assertRaises(Exception):
+            self.storage.upsert([make_row("a", "x" * 300)])
+        self.assertEqual(self.storage.query("SELECT COUNT(*) FROM email_keys"), [(0,)])
+        self.assertEqual(self.storage.upsert([make_row("a")]), [False])
+
+    def test_migration_backfills_key_counts(self):
+        self.storage.close()
+        url = f"jdbc:h2:{self.tmp_dir}/old_db"
+        with mock.patch.object(storage, "H2_MIGRATIONS", storage.H2_MIGRATIONS[:2]):
+            old = H2Storage(url)
+            old.insert([make_row("a"), make_row("a", "resend.eml"), make_row("b")])
+            old.close()
+        self.storage = H2Storage(url)
+        self.assertEqual(self.storage.query("SELECT email_hash, seen_count FROM email_keys ORDER BY email_hash"), [("a", 2), ("b", 1)])
+        self.assertEqual(self.storage.upsert([make_row("a")]), [True])
+
+
+class FlakyStorage:
+    """Upserts into an in-memory list; fails while failures is above zero, or for any bad hash."""
+
+    def __init__(self, failures=0, bad_hashes=()):
+        self.failures = failures
+        self.bad_hashes = set(bad_hashes)
+        self.rows = []
+
+    def upsert(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database unavailable")
+        if any(row[5] in self.bad_hashes for row in rows):
+            raise ValueError("value too long for column")
+        seen = {row_key(row) for row in self.rows}
+        is_duplicate = []
+        for row in rows:
+            is_duplicate.append(row_key(row) in seen)
+            seen.add(row_key(row))
+        self.rows.extend(rows)
+        return is_duplicate
+
+
+class EmailBatchWriterTest(unittest.TestCase):
+    def add(self, writer, email_hash):
+        return writer.add(make_row(email_hash, f"{email_hash}.eml"), {'filename': f"{email_hash}.eml", 'stored': False})
+
+    def test_rows_are_stored_per_chunk(self):
+        storage = FlakyStorage()
+        writer = EmailBatchWriter(storage, chunk_size=2, flush_interval=60)
+        self.assertEqual(self.add(writer, "a"), [])
+        self.assertIsNotNone(writer.seconds_until_flush())
+        stored = self.add(writer, "b")
+        self.assertEqual([result['filename'] for result in stored], ["a.eml", "b.eml"])
+        self.assertTrue(all(result['stored'] for result in stored))
+        self.assertIsNone(writer.seconds_until_flush())
+        self.assertEqual(len(storage.rows), 2)
+
+    def test_close_stores_the_partial_chunk(self):
+        writer = EmailBatchWriter(FlakyStorage(), chunk_size=10, flush_interval=60)
+        self.add(writer, "a")
+        self.assertEqual([result['is_duplicate'] for result in writer.close()], [False])
+
+    def test_failed_chunk_is_kept_and_retried(self):
+        storage = FlakyStorage(failures=2)
+        writer = EmailBatchWriter(storage, chunk_size=1, flush_interval=0)
+        self.assertEqual(self.add(writer, "a"), [])
+        stored = writer.flush()
+        self.assertEqual([(result['filename'], result['stored']) for result in stored], [("a.eml", True)])
+
+    def test_bad_row_does_not_hold_back_its_chunk(self):
+        storage = FlakyStorage(bad_hashes={"bad"})
+        writer = EmailBatchWriter(storage, chunk_size=10, flush_interval=60)
+        for email_hash in ["ok1", "bad", "ok2", "ok3"]:
+            self.add(writer, email_hash)
+        results = writer.flush()
+        self.assertEqual([(result['filename'], result['stored']) for result in results],
+                         [("ok1.eml", True), ("bad.eml", False), ("ok2.eml", True), ("ok3.eml", True)])
+        self.assertEqual(sorted(row[5] for row in storage.rows), ["ok1", "ok2", "ok3"])
+        self.assertIsNone(writer.seconds_until_flush())
+
+    def test_failing_database_keeps_the_whole_chunk(self):
+        storage = FlakyStorage(failures=100)
+        writer = EmailBatchWriter(storage, chunk_size=10, flush_interval=60)
+        for email_hash in ["a", "b", "c", "d"]:
+            self.add(writer, email_hash)
+        self.assertEqual(writer.flush(), [])
+        storage.failures = 0
+        self.assertEqual(len(writer.flush()), 4)
+
+    def test_close_reports_rows_that_were_never_stored(self):
+        writer = EmailBatchWriter(FlakyStorage(failures=10), chunk_size=1, flush_interval=60)
+        self.add(writer, "a")
+        results = writer.close()
+        self.assertEqual([(result['stored'], result['is_duplicate']) for result in results], [(False, None)])
+
+
+if __name__ == "__main__":
+    unittest.main()